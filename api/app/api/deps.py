@@ -1,27 +1,92 @@
+import asyncio
+import hashlib
 import re
+import time
+from collections import OrderedDict
 import httpx
 from fastapi import Header, HTTPException, Depends
+from redis.exceptions import RedisError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
-from jose import jwt, JWTError
+from jose import jwk, jwt, JWTError
+from jose.backends.base import Key
+from jose.exceptions import JWKError
+from app.core import metrics
+from app.core.cache import get_redis, get_version, bump_version
 from app.core.config import settings
 from app.core.database import get_db, get_tenant_session, provision_org_schema
 from app.schemas.schemas import OrgContext
 
-# Cache JWKS so we don't fetch on every request
-_jwks_cache: dict | None = None
+# ── Clerk signing keys ─────────────────────────────────────────────────────
+# Parsed JWKS keys by kid. Refreshed on a background schedule by
+# jwks_refresh_loop(); a request only fetches on an unknown kid, and concurrent
+# fetches collapse into one behind _jwks_lock.
 
+_jwks_keys: dict[str, Key] = {}
+_jwks_fetched_at = 0.0
+_jwks_lock = asyncio.Lock()
 
-async def _get_jwks() -> dict:
-    global _jwks_cache
-    if _jwks_cache is None:
+
+async def _refresh_jwks(if_older_than: float = 0.0) -> None:
+    global _jwks_keys, _jwks_fetched_at
+    async with _jwks_lock:
+        # Another request may have refreshed while we waited for the lock
+        if time.monotonic() - _jwks_fetched_at < if_older_than:
+            return
         async with httpx.AsyncClient() as client:
             resp = await client.get(
                 "https://api.clerk.com/v1/jwks",
                 headers={"Authorization": f"Bearer {settings.CLERK_SECRET_KEY}"},
             )
-            _jwks_cache = resp.json()
-    return _jwks_cache
+            resp.raise_for_status()
+        _jwks_keys = {k["kid"]: jwk.construct(k, algorithm="RS256") for k in resp.json()["keys"]}
+        _jwks_fetched_at = time.monotonic()
+        metrics.incr("jwks.refreshes")
+
+
+async def _get_signing_key(kid: str) -> Key | None:
+    key = _jwks_keys.get(kid)
+    if key is None:
+        # Unknown kid: Clerk may have rotated keys. Rate-limited so a flood of
+        # forged kids can't turn into a flood of JWKS fetches.
+        await _refresh_jwks(if_older_than=settings.JWKS_MIN_REFRESH_SECONDS)
+        key = _jwks_keys.get(kid)
+    return key
+
+
+async def jwks_refresh_loop() -> None:
+    """Keep signing keys warm; started from the app lifespan."""
+    while True:
+        try:
+            await _refresh_jwks()
+        except (httpx.HTTPError, KeyError, ValueError, JWKError):
+            metrics.incr("jwks.refresh_errors")
+        await asyncio.sleep(settings.JWKS_REFRESH_SECONDS)
+
+
+# Verified claims by token digest, each entry expiring with the token itself
+_verified_claims: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+
+def _get_verified_claims(digest: str) -> dict | None:
+    entry = _verified_claims.get(digest)
+    if entry is None:
+        return None
+    if entry[0] <= time.time():
+        del _verified_claims[digest]
+        return None
+    _verified_claims.move_to_end(digest)
+    return entry[1]
+
+
+def _store_verified_claims(digest: str, claims: dict) -> None:
+    exp = claims.get("exp")
+    if not isinstance(exp, (int, float)):
+        return
+    _verified_claims[digest] = (min(exp, time.time() + settings.JWT_CLAIMS_CACHE_MAX_SECONDS), claims)
+    _verified_claims.move_to_end(digest)
+    while len(_verified_claims) > settings.JWT_CLAIMS_CACHE_MAX_ENTRIES:
+        _verified_claims.popitem(last=False)
 
 
 def _schema_for(clerk_id: str) -> str:
@@ -33,21 +98,73 @@ async def verify_clerk_token(authorization: str = Header(...)) -> dict:
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Invalid authorization header")
     token = authorization[7:]
+    digest = hashlib.sha256(token.encode()).hexdigest()
+    claims = _get_verified_claims(digest)
+    if claims is not None:
+        metrics.incr("jwt_claims_cache.hits")
+        return claims
+
+    metrics.incr("jwt_claims_cache.misses")
     try:
-        jwks = await _get_jwks()
         header = jwt.get_unverified_header(token)
-        key = next((k for k in jwks["keys"] if k["kid"] == header["kid"]), None)
-        if not key:
-            # Stale cache — refresh and retry once
-            global _jwks_cache
-            _jwks_cache = None
-            jwks = await _get_jwks()
-            key = next((k for k in jwks["keys"] if k["kid"] == header["kid"]), None)
+        key = await _get_signing_key(header.get("kid", ""))
         if not key:
             raise HTTPException(status_code=401, detail="Unknown signing key")
-        return jwt.decode(token, key, algorithms=["RS256"])
+        claims = jwt.decode(token, key, algorithms=["RS256"])
     except JWTError as e:
         raise HTTPException(status_code=401, detail=f"Invalid token: {e}")
+    _store_verified_claims(digest, claims)
+    return claims
+
+
+# ── OrgContext cache ───────────────────────────────────────────────────────
+# (sub, workspace) -> resolved OrgContext, in a process-local LRU backed by
+# Redis. Keys embed the schema's version stamp, which invalidate_org_context()
+# bumps whenever membership, roles or org settings change.
+
+_ORG_CONTEXT_NAMESPACE = "org_context"
+_local_contexts: OrderedDict[str, tuple[float, OrgContext]] = OrderedDict()
+
+
+async def _get_cached_context(key: str) -> OrgContext | None:
+    entry = _local_contexts.get(key)
+    if entry and entry[0] > time.monotonic():
+        _local_contexts.move_to_end(key)
+        metrics.incr("org_context_cache.hits")
+        return entry[1]
+
+    try:
+        raw = await get_redis().get(key)
+    except RedisError:
+        raw = None
+    if not raw:
+        metrics.incr("org_context_cache.misses")
+        return None
+
+    ctx = OrgContext.model_validate_json(raw)
+    _store_local_context(key, ctx)
+    metrics.incr("org_context_cache.hits")
+    return ctx
+
+
+def _store_local_context(key: str, ctx: OrgContext) -> None:
+    _local_contexts[key] = (time.monotonic() + settings.ORG_CONTEXT_LOCAL_TTL_SECONDS, ctx)
+    _local_contexts.move_to_end(key)
+    while len(_local_contexts) > settings.ORG_CONTEXT_LOCAL_MAX_ENTRIES:
+        _local_contexts.popitem(last=False)
+
+
+async def _store_cached_context(key: str, ctx: OrgContext) -> None:
+    _store_local_context(key, ctx)
+    try:
+        await get_redis().set(key, ctx.model_dump_json(), ex=settings.ORG_CONTEXT_REDIS_TTL_SECONDS)
+    except RedisError:
+        pass
+
+
+async def invalidate_org_context(schema: str) -> None:
+    """Force every cached OrgContext for this org to be re-resolved."""
+    await bump_version(_ORG_CONTEXT_NAMESPACE, schema)
 
 
 async def get_org_context(
@@ -61,6 +178,18 @@ async def get_org_context(
     workspace_id = clerk_org_id or f"personal_{clerk_user_id}"
     schema = _schema_for(workspace_id)
 
+    version = await get_version(_ORG_CONTEXT_NAMESPACE, schema)
+    cache_key = f"org_context:{version}:{workspace_id}:{clerk_user_id}"
+    ctx = await _get_cached_context(cache_key)
+    if ctx is None:
+        ctx = await _resolve_org_context(claims, db, clerk_user_id, workspace_id, schema)
+        await _store_cached_context(cache_key, ctx)
+    return ctx
+
+
+async def _resolve_org_context(
+    claims: dict, db: AsyncSession, clerk_user_id: str, workspace_id: str, schema: str,
+) -> OrgContext:
     # Auto-provision org row + schema on first request (no webhook required)
     result = await db.execute(
         text("SELECT * FROM public.organizations WHERE clerk_org_id = :id"),
@@ -123,6 +252,7 @@ async def get_org_context(
         user_clerk_id=clerk_user_id,
         user_id=user["id"],
         user_role=user["role"],
+        speculative_filtering=bool(org.get("speculative_filtering")),
     )
 
 
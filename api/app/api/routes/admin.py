@@ -1,13 +1,16 @@
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy import text
-from app.api.deps import require_admin
+from app.api.deps import require_admin, invalidate_org_context
 from app.schemas.schemas import (
     OrgContext, FilteringRuleCreate, FilteringRuleUpdate,
     GPTConnectionCreate, UserRoleUpdate, AgentCreate, AgentUpdate, AgentAssignmentCreate,
 )
 from app.core.database import get_tenant_session
 from app.core.security import encrypt_api_key
+from app.services.filtering import filtering_service
+from app.services.prompts import invalidate_prompts
+from app.services.proxy import invalidate_connections
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -37,6 +40,7 @@ async def create_rule(body: FilteringRuleCreate, ctx: OrgContext = Depends(requi
             body.model_dump(),
         )
         await session.commit()
+        await filtering_service.invalidate(ctx.schema_name)
         return dict(result.fetchone()._mapping)
     finally:
         await session.close()
@@ -58,6 +62,7 @@ async def update_rule(rule_id: UUID, body: FilteringRuleUpdate, ctx: OrgContext
             updates,
         )
         await session.commit()
+        await filtering_service.invalidate(ctx.schema_name)
         row = result.fetchone()
         if not row:
             raise HTTPException(status_code=404, detail="Rule not found")
@@ -75,6 +80,7 @@ async def delete_rule(rule_id: UUID, ctx: OrgContext = Depends(require_admin)):
             {"id": str(rule_id)},
         )
         await session.commit()
+        await filtering_service.invalidate(ctx.schema_name)
         return {"ok": True}
     finally:
         await session.close()
@@ -109,6 +115,7 @@ async def upsert_connection(body: GPTConnectionCreate, ctx: OrgContext = Depends
             {"provider": body.provider, "encrypted_api_key": encrypted, "model": body.model},
         )
         await session.commit()
+        await invalidate_connections(ctx.schema_name)
         return dict(result.fetchone()._mapping)
     finally:
         await session.close()
@@ -120,6 +127,7 @@ async def delete_connection(provider: str, ctx: OrgContext = Depends(require_adm
     try:
         await session.execute(text("DELETE FROM gpt_connections WHERE provider = :p"), {"p": provider})
         await session.commit()
+        await invalidate_connections(ctx.schema_name)
         return {"ok": True}
     finally:
         await session.close()
@@ -146,6 +154,7 @@ async def update_user_role(user_id: UUID, body: UserRoleUpdate, ctx: OrgContext
             {"role": body.role, "id": str(user_id)},
         )
         await session.commit()
+        await invalidate_org_context(ctx.schema_name)
         row = result.fetchone()
         if not row:
             raise HTTPException(status_code=404, detail="User not found")
@@ -163,6 +172,7 @@ async def remove_user(user_id: UUID, ctx: OrgContext = Depends(require_admin)):
             {"id": str(user_id), "self": ctx.user_clerk_id},
         )
         await session.commit()
+        await invalidate_org_context(ctx.schema_name)
         return {"ok": True}
     finally:
         await session.close()
@@ -203,6 +213,7 @@ async def upsert_assignment(body: AgentAssignmentCreate, ctx: OrgContext = Depen
             {"user_id": str(body.user_id), "agent_id": str(body.agent_id)},
         )
         await session.commit()
+        await invalidate_prompts(ctx.schema_name)
         return dict(result.fetchone()._mapping)
     finally:
         await session.close()
@@ -217,6 +228,7 @@ async def remove_assignment(user_id: UUID, ctx: OrgContext = Depends(require_adm
             {"uid": str(user_id)},
         )
         await session.commit()
+        await invalidate_prompts(ctx.schema_name)
         return {"ok": True}
     finally:
         await session.close()
@@ -267,6 +279,7 @@ async def update_agent(agent_id: UUID, body: AgentUpdate, ctx: OrgContext = Depe
             updates,
         )
         await session.commit()
+        await invalidate_prompts(ctx.schema_name)
         row = result.fetchone()
         if not row:
             raise HTTPException(status_code=404, detail="Agent not found")
@@ -284,6 +297,7 @@ async def delete_agent(agent_id: UUID, ctx: OrgContext = Depends(require_admin))
             {"id": str(agent_id)},
         )
         await session.commit()
+        await invalidate_prompts(ctx.schema_name)
         return {"ok": True}
     finally:
         await session.close()
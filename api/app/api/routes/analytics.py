@@ -1,48 +1,74 @@
-from fastapi import APIRouter, Depends, Query
+import base64
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from typing import Literal, Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy import text
+from app.core.config import settings
 from app.api.deps import require_admin
 from app.schemas.schemas import OrgContext
 from app.core.database import get_tenant_session
-from app.services.analytics import get_summary
+from app.services.analytics import get_cached_summary
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
 
 @router.get("/summary")
 async def summary(days: int = Query(default=30, ge=1, le=365), ctx: OrgContext = Depends(require_admin)):
-    session = await get_tenant_session(ctx.schema_name)
+    return await get_cached_summary(ctx.schema_name, days)
+
+
+def _encode_cursor(updated_at: datetime, session_id) -> str:
+    return base64.urlsafe_b64encode(f"{updated_at.isoformat()}|{session_id}".encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, str]:
     try:
-        return await get_summary(session, days)
-    finally:
-        await session.close()
+        updated_at, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(updated_at), str(UUID(session_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 @router.get("/conversations")
 async def list_conversations(
     limit: int = Query(default=50, le=200),
-    offset: int = Query(default=0),
+    cursor: Optional[str] = Query(default=None),
     ctx: OrgContext = Depends(require_admin),
 ):
-    """Admin view of all conversations in the org."""
+    """Admin view of all conversations in the org, newest activity first.
+
+    Keyset-paginated on (updated_at, id): pass the last row's `cursor` to get
+    the next page.
+    """
+    params: dict = {"limit": limit}
+    after = ""
+    if cursor:
+        params["after_ts"], params["after_id"] = _decode_cursor(cursor)
+        after = "WHERE (s.updated_at, s.id) < (:after_ts, CAST(:after_id AS uuid))"
+
     session = await get_tenant_session(ctx.schema_name)
     try:
-        from sqlalchemy import text
         result = await session.execute(
-            text("""
+            text(f"""
                 SELECT s.id, s.title, s.gpt_target, s.created_at, s.updated_at,
-                       u.email as user_email,
-                       COUNT(m.id) as message_count,
-                       SUM(CASE WHEN m.was_blocked THEN 1 ELSE 0 END) as blocked_count
+                       u.email as user_email, s.message_count, s.blocked_count
                 FROM sessions s
                 JOIN users u ON s.user_id = u.id
-                LEFT JOIN messages m ON m.session_id = s.id
-                GROUP BY s.id, u.email
-                ORDER BY s.updated_at DESC
-                LIMIT :limit OFFSET :offset
+                {after}
+                ORDER BY s.updated_at DESC, s.id DESC
+                LIMIT :limit
             """),
-            {"limit": limit, "offset": offset},
+            params,
         )
-        return [dict(r._mapping) for r in result]
+        return [
+            {**r._mapping, "cursor": _encode_cursor(r.updated_at, r.id)}
+            for r in result
+        ]
     finally:
         await session.close()
 
@@ -61,6 +87,79 @@ async def get_conversation(session_id: str, ctx: OrgContext = Depends(require_ad
         await session.close()
 
 
+_EXPORT_COLUMNS = [
+    "message_id", "session_id", "session_title", "user_email", "role", "content",
+    "was_blocked", "block_reason", "gpt_target", "tokens_used", "cached_tokens", "created_at",
+]
+
+
+@router.get("/export")
+async def export_messages(
+    export_format: Literal["ndjson", "csv"] = Query(default="ndjson", alias="format"),
+    since: Optional[datetime] = Query(default=None),
+    until: Optional[datetime] = Query(default=None),
+    user_id: Optional[UUID] = Query(default=None),
+    ctx: OrgContext = Depends(require_admin),
+):
+    """Stream every message in the org (optionally filtered) as NDJSON or CSV.
+
+    Rows are read through a server-side cursor and written out batch by batch,
+    so memory use does not grow with the size of the export.
+    """
+    filters, params = [], {}
+    if since:
+        filters.append("m.created_at >= :since")
+        params["since"] = since
+    if until:
+        filters.append("m.created_at < :until")
+        params["until"] = until
+    if user_id:
+        filters.append("s.user_id = CAST(:user_id AS uuid)")
+        params["user_id"] = str(user_id)
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+    schema = ctx.schema_name
+
+    async def rows():
+        session = await get_tenant_session(schema)
+        try:
+            result = await session.stream(
+                text(f"""
+                    SELECT m.id AS message_id, m.session_id, s.title AS session_title, u.email AS user_email,
+                           m.role, m.content, m.was_blocked, m.block_reason, m.gpt_target, m.tokens_used, m.cached_tokens, m.created_at
+                    FROM messages m
+                    JOIN sessions s ON s.id = m.session_id
+                    JOIN users u ON u.id = s.user_id
+                    {where}
+                    ORDER BY m.created_at
+                """),
+                params,
+                execution_options={"yield_per": settings.EXPORT_BATCH_ROWS},
+            )
+            if export_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(_EXPORT_COLUMNS)
+                async for batch in result.partitions():
+                    writer.writerows(batch)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                if buffer.tell():
+                    yield buffer.getvalue()
+            else:
+                async for batch in result.partitions():
+                    yield "".join(json.dumps(dict(r._mapping), default=str) + "\n" for r in batch)
+        finally:
+            await session.close()
+
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    filename = f"messages-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.{export_format}"
+    return StreamingResponse(
+        rows(), media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @router.get("/team")
 async def team_analytics(
     days: int = Query(default=30, ge=1, le=365),
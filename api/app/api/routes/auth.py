@@ -3,6 +3,7 @@ from sqlalchemy import text
 from svix.webhooks import Webhook, WebhookVerificationError
 from app.core.config import settings
 from app.core.database import get_db, provision_org_schema
+from app.api.deps import invalidate_org_context
 import re
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -44,6 +45,7 @@ async def clerk_webhook(request: Request, svix_id: str = Header(None), svix_time
                 {"id": clerk_org_id, "name": org_name, "schema": schema},
             )
             await db.commit()
+            await invalidate_org_context(schema)
 
         elif event_type == "organizationMembership.created":
             clerk_org_id = data["organization"]["id"]
@@ -68,6 +70,7 @@ async def clerk_webhook(request: Request, svix_id: str = Header(None), svix_time
                     await tenant.commit()
                 finally:
                     await tenant.close()
+                await invalidate_org_context(schema)
 
         elif event_type == "organizationMembership.deleted":
             clerk_org_id = data["organization"]["id"]
@@ -89,5 +92,6 @@ async def clerk_webhook(request: Request, svix_id: str = Header(None), svix_time
                     await tenant.commit()
                 finally:
                     await tenant.close()
+                await invalidate_org_context(row.schema_name)
 
     return {"ok": True}
@@ -1,16 +1,22 @@
+import asyncio
 import json
+from typing import AsyncIterator
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
 from sqlalchemy import text
-from sqlalchemy.ext.asyncio import AsyncSession
 from app.api.deps import get_org_context
 from app.schemas.schemas import ChatRequest, OrgContext
-from app.core.database import get_tenant_session, get_db
+from app.core import metrics
+from app.core.database import get_tenant_session
 from app.services.filtering import filtering_service
 from app.services.proxy import stream_gpt
-from app.services.verticals import build_system_prompt
-from app.workers.tasks import process_analytics, generate_suggestions, generate_session_title
+from app.services.prompts import get_prompt_context
+from app.services.verticals import build_document_context
+from app.services.analytics_buffer import record_event
+from app.services.history import load_history_window
+from app.services.rag import retrieve_documents
+from app.workers.tasks import generate_suggestions, generate_session_title, summarize_history
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
@@ -53,6 +59,49 @@ async def get_messages(session_id: UUID, ctx: OrgContext = Depends(get_org_conte
         await session.close()
 
 
+def _discard_task(task: asyncio.Task) -> None:
+    """Cancel a background task nobody will await, retrieving any error it already raised."""
+    task.cancel()
+    if task.done() and not task.cancelled():
+        task.exception()
+
+
+class _BufferedUpstream:
+    """Consumes an upstream stream in the background, holding chunks until read.
+
+    Used for speculative filtering: the provider request starts at once, but
+    nothing is released to the client until the semantic verdict allows it.
+    aclose() aborts the provider request.
+    """
+
+    _END = object()
+
+    def __init__(self, upstream: AsyncIterator[str]):
+        self._buffer: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._pump(upstream))
+
+    async def _pump(self, upstream: AsyncIterator[str]):
+        try:
+            async for chunk in upstream:
+                self._buffer.put_nowait(chunk)
+            self._buffer.put_nowait(self._END)
+        except Exception as e:
+            self._buffer.put_nowait(e)
+
+    async def aclose(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def __aiter__(self):
+        while (item := await self._buffer.get()) is not self._END:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
 async def _load_agent_context(ctx: OrgContext, tenant) -> dict | None:
     """Return the active agent assigned to the calling user, or None."""
     result = await tenant.execute(
@@ -68,22 +117,6 @@ async def _load_agent_context(ctx: OrgContext, tenant) -> dict | None:
     return dict(row._mapping) if row else None
 
 
-async def _load_org_context(ctx: OrgContext, db: AsyncSession, tenant) -> tuple[str, str]:
-    """Returns (vertical, doc_context_str) for use in system prompts."""
-    org_row = await db.execute(
-        text("SELECT vertical FROM public.organizations WHERE clerk_org_id = :id"),
-        {"id": ctx.clerk_org_id},
-    )
-    row = org_row.fetchone()
-    vertical = (row.vertical if row else None) or "general"
-
-    docs_row = await tenant.execute(
-        text(f'SELECT filename, content_text FROM "{ctx.schema_name}".org_documents ORDER BY created_at LIMIT 5')
-    )
-    docs = [dict(r._mapping) for r in docs_row]
-    return vertical, docs
-
-
 @router.get("/agent-context")
 async def get_agent_context(ctx: OrgContext = Depends(get_org_context)):
     """Return the active agent assigned to the calling user (or null)."""
@@ -96,9 +129,10 @@ async def get_agent_context(ctx: OrgContext = Depends(get_org_context)):
 
 
 @router.post("/")
-async def chat(req: ChatRequest, ctx: OrgContext = Depends(get_org_context), db: AsyncSession = Depends(get_db)):
+async def chat(req: ChatRequest, ctx: OrgContext = Depends(get_org_context)):
     schema = ctx.schema_name
     session = await get_tenant_session(schema)
+    semantic_check = None
     try:
         # Create or get session
         if req.session_id:
@@ -117,84 +151,172 @@ async def chat(req: ChatRequest, ctx: OrgContext = Depends(get_org_context), db:
             session_id = result.fetchone().id
             await session.commit()
 
-        # Run filtering (uses schema-qualified queries)
-        filter_result = await filtering_service.evaluate(req.message, session, schema)
+        # Run filtering (uses schema-qualified queries). In speculative mode the
+        # slow semantic pass is deferred and overlapped with the upstream call.
+        filter_result = await filtering_service.evaluate(
+            req.message, session, schema, defer_semantic=ctx.speculative_filtering,
+        )
 
         if filter_result.action == "block":
             await session.execute(
                 text(f"""
-                    INSERT INTO {s(schema, 'messages')} (session_id, role, content, was_blocked, block_reason, gpt_target)
-                    VALUES (:sid, 'user', :content, TRUE, :reason, :gpt)
+                    WITH inserted AS (
+                        INSERT INTO {s(schema, 'messages')} (session_id, role, content, was_blocked, block_reason, gpt_target)
+                        VALUES (:sid, 'user', :content, TRUE, :reason, :gpt)
+                    )
+                    UPDATE {s(schema, 'sessions')}
+                    SET message_count = message_count + 1, blocked_count = blocked_count + 1
+                    WHERE id = :sid
                 """),
                 {"sid": str(session_id), "content": req.message, "reason": filter_result.reason, "gpt": req.gpt_target},
             )
             await session.commit()
-            process_analytics.delay(schema, "message_blocked", str(ctx.user_id), str(session_id), {"reason": filter_result.reason})
+            await record_event(schema, "message_blocked", str(ctx.user_id), str(session_id), {"reason": filter_result.reason})
 
             async def blocked_stream():
                 yield f"data: {json.dumps({'blocked': True, 'reason': filter_result.reason})}\n\n"
 
             return StreamingResponse(blocked_stream(), media_type="text/event-stream")
 
+        if filter_result.pending_semantic_rules:
+            semantic_check = asyncio.create_task(
+                filtering_service.evaluate_semantic(schema, req.message, filter_result.pending_semantic_rules)
+            )
+
         content_to_send = filter_result.modified_content if filter_result.action == "modify" else req.message
 
         # Save user message
-        await session.execute(
-            text(f"INSERT INTO {s(schema, 'messages')} (session_id, role, content, gpt_target) VALUES (:sid, 'user', :content, :gpt)"),
+        result = await session.execute(
+            text(f"""
+                WITH counted AS (
+                    UPDATE {s(schema, 'sessions')} SET message_count = message_count + 1 WHERE id = :sid
+                )
+                INSERT INTO {s(schema, 'messages')} (session_id, role, content, gpt_target)
+                VALUES (:sid, 'user', :content, :gpt) RETURNING id
+            """),
             {"sid": str(session_id), "content": req.message, "gpt": req.gpt_target},
         )
+        user_message_id = result.fetchone().id
 
-        # Load conversation history
-        history = await session.execute(
-            text(f"SELECT role, content FROM {s(schema, 'messages')} WHERE session_id = :sid AND was_blocked = FALSE ORDER BY created_at"),
-            {"sid": str(session_id)},
-        )
-        messages = [{"role": r.role, "content": r.content} for r in history]
+        # Load the bounded conversation window (older turns live in the summary)
+        history = await load_history_window(session, schema, session_id)
+        messages = history.messages
         messages[-1]["content"] = content_to_send
 
-        # Load vertical + docs for system context
-        vertical, docs = await _load_org_context(ctx, db, session)
-        system_prompt = build_system_prompt(vertical, docs)
+        # Prebuilt agent + vertical prefix (stable, so providers can cache it);
+        # the document chunks and summary for this turn go in separately
+        prompt = await get_prompt_context(ctx, session)
+        vertical = prompt.vertical
+        docs = await retrieve_documents(session, schema, content_to_send)
+        turn_context = build_document_context(docs)
 
-        # Prepend agent system prompt if assigned
-        agent = await _load_agent_context(ctx, session)
-        if agent:
-            system_prompt = agent["system_prompt"] + "\n\n" + system_prompt
+        if history.summary:
+            turn_context += "\n\nSummary of the earlier conversation:\n" + history.summary
+        turn_context = turn_context.strip() or None
 
         await session.commit()
 
+        async def mark_blocked(reason: str | None):
+            block_session = await get_tenant_session(schema)
+            try:
+                await block_session.execute(
+                    text(f"""
+                        WITH blocked AS (
+                            UPDATE {s(schema, 'messages')} SET was_blocked = TRUE, block_reason = :reason
+                            WHERE id = :mid AND was_blocked = FALSE
+                            RETURNING session_id
+                        )
+                        UPDATE {s(schema, 'sessions')} SET blocked_count = blocked_count + 1
+                        WHERE id IN (SELECT session_id FROM blocked)
+                    """),
+                    {"reason": reason, "mid": str(user_message_id)},
+                )
+                await block_session.commit()
+            finally:
+                await block_session.close()
+            await record_event(schema, "message_blocked", str(ctx.user_id), str(session_id), {"reason": reason})
+
         async def response_stream():
             full_response = []
+            usage: dict = {}
+            speculative = None
             try:
-                async for chunk in stream_gpt(req.gpt_target, messages, session, schema, system_prompt=system_prompt):
+                upstream = stream_gpt(
+                    req.gpt_target, messages, session, schema,
+                    system_prompt=prompt.prefix, context=turn_context, usage=usage,
+                )
+                if semantic_check is not None:
+                    speculative = _BufferedUpstream(upstream)
+                    verdict = await semantic_check
+                    if verdict.action == "block":
+                        await speculative.aclose()
+                        await mark_blocked(verdict.reason)
+                        yield f"data: {json.dumps({'blocked': True, 'reason': verdict.reason})}\n\n"
+                        return
+                    if verdict.action == "modify":
+                        # Discard the speculative answer and re-ask with the redacted message
+                        await speculative.aclose()
+                        messages[-1]["content"] = verdict.modified_content or req.message
+                        usage.clear()
+                        upstream = stream_gpt(
+                            req.gpt_target, messages, session, schema,
+                            system_prompt=prompt.prefix, context=turn_context, usage=usage,
+                        )
+                    else:
+                        upstream = speculative
+
+                async for chunk in upstream:
                     full_response.append(chunk)
                     yield f"data: {json.dumps({'chunk': chunk})}\n\n"
             except Exception as e:
                 yield f"data: {json.dumps({'error': str(e)})}\n\n"
                 return
+            finally:
+                if speculative is not None:
+                    await speculative.aclose()
+                if semantic_check is not None:
+                    _discard_task(semantic_check)
 
             complete = "".join(full_response)
+            tokens_used = None
+            if usage:
+                tokens_used = usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+                metrics.incr(f"provider.{req.gpt_target}.input_tokens", usage.get("input_tokens", 0))
+                metrics.incr(f"provider.{req.gpt_target}.cached_tokens", usage.get("cached_tokens", 0))
             save_session = await get_tenant_session(schema)
             try:
                 await save_session.execute(
-                    text(f"INSERT INTO {s(schema, 'messages')} (session_id, role, content, gpt_target) VALUES (:sid, 'assistant', :content, :gpt)"),
-                    {"sid": str(session_id), "content": complete, "gpt": req.gpt_target},
+                    text(f"""
+                        INSERT INTO {s(schema, 'messages')} (session_id, role, content, gpt_target, tokens_used, cached_tokens)
+                        VALUES (:sid, 'assistant', :content, :gpt, :tokens, :cached)
+                    """),
+                    {
+                        "sid": str(session_id), "content": complete, "gpt": req.gpt_target,
+                        "tokens": tokens_used, "cached": usage.get("cached_tokens"),
+                    },
                 )
                 await save_session.execute(
-                    text(f"UPDATE {s(schema, 'sessions')} SET updated_at = NOW() WHERE id = :sid"),
+                    text(f"UPDATE {s(schema, 'sessions')} SET updated_at = NOW(), message_count = message_count + 1 WHERE id = :sid"),
                     {"sid": str(session_id)},
                 )
                 await save_session.commit()
             finally:
                 await save_session.close()
 
-            process_analytics.delay(schema, "message_sent", str(ctx.user_id), str(session_id), {"provider": req.gpt_target})
+            await record_event(schema, "message_sent", str(ctx.user_id), str(session_id), {"provider": req.gpt_target})
             doc_context = "\n".join(d["content_text"][:500] for d in docs[:2])
             generate_suggestions.delay(schema, str(session_id), str(ctx.user_id), vertical, doc_context)
             generate_session_title.delay(schema, str(session_id))
+            if history.needs_summary:
+                summarize_history.delay(schema, str(session_id))
 
             yield f"data: {json.dumps({'done': True, 'session_id': str(session_id)})}\n\n"
 
         return StreamingResponse(response_stream(), media_type="text/event-stream")
+    except BaseException:
+        # Don't leave the overlapped semantic check running unobserved
+        if semantic_check is not None:
+            _discard_task(semantic_check)
+        raise
     finally:
         await session.close()
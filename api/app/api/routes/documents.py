@@ -1,13 +1,16 @@
-import io
+from uuid import UUID
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
 from sqlalchemy import text
 from app.api.deps import require_admin, get_org_context
 from app.schemas.schemas import OrgContext
+from app.core.config import settings
 from app.core.database import get_tenant_session
+from app.workers.tasks import extract_document
 
 router = APIRouter(prefix="/admin/documents", tags=["documents"])
 
 MAX_FILE_BYTES = 10 * 1024 * 1024  # 10 MB
+UPLOAD_READ_BYTES = 1024 * 1024
 ALLOWED_TYPES = {
     "text/plain", "text/markdown", "text/csv",
     "application/pdf",
@@ -15,32 +18,6 @@ ALLOWED_TYPES = {
 }
 
 
-def _extract_text(data: bytes, content_type: str, filename: str) -> str:
-    """Extract plain text from various file formats."""
-    if content_type == "application/pdf":
-        try:
-            from pypdf import PdfReader
-            reader = PdfReader(io.BytesIO(data))
-            pages = [page.extract_text() or "" for page in reader.pages]
-            return "\n\n".join(pages).strip()
-        except Exception as e:
-            raise HTTPException(status_code=422, detail=f"Could not parse PDF: {e}")
-
-    if content_type in ("application/vnd.openxmlformats-officedocument.wordprocessingml.document",):
-        try:
-            from docx import Document
-            doc = Document(io.BytesIO(data))
-            return "\n".join(p.text for p in doc.paragraphs if p.text.strip())
-        except Exception as e:
-            raise HTTPException(status_code=422, detail=f"Could not parse DOCX: {e}")
-
-    # Plain text / markdown / CSV
-    try:
-        return data.decode("utf-8", errors="replace")
-    except Exception as e:
-        raise HTTPException(status_code=422, detail=f"Could not decode file: {e}")
-
-
 @router.get("/")
 async def list_documents(
     ctx: OrgContext = Depends(get_org_context),
@@ -55,11 +32,12 @@ async def list_documents(
         await tenant.close()
 
 
-@router.post("/")
+@router.post("/", status_code=202)
 async def upload_document(
     file: UploadFile = File(...),
     ctx: OrgContext = Depends(require_admin),
 ):
+    """Stage an upload and queue text extraction; poll /jobs/{job_id} for progress."""
     ct = file.content_type or "text/plain"
     if ct not in ALLOWED_TYPES:
         raise HTTPException(
@@ -67,28 +45,63 @@ async def upload_document(
             detail="Unsupported file type. Allowed: PDF, TXT, MD, CSV, DOCX",
         )
 
-    data = await file.read()
-    if len(data) > MAX_FILE_BYTES:
-        raise HTTPException(status_code=400, detail="File must be under 10 MB")
+    data = bytearray()
+    while chunk := await file.read(UPLOAD_READ_BYTES):
+        data += chunk
+        if len(data) > MAX_FILE_BYTES:
+            raise HTTPException(status_code=400, detail="File must be under 10 MB")
     if not data.strip():
         raise HTTPException(status_code=400, detail="File is empty")
 
-    content_text = _extract_text(data, ct, file.filename or "document")
-    if not content_text.strip():
-        raise HTTPException(status_code=422, detail="Could not extract any text from the file")
-
     tenant = await get_tenant_session(ctx.schema_name)
     try:
         result = await tenant.execute(
             text(
-                f'INSERT INTO "{ctx.schema_name}".org_documents (filename, content_text, file_size) '
-                f'VALUES (:filename, :content_text, :file_size) RETURNING id, filename, file_size, created_at'
+                f'INSERT INTO "{ctx.schema_name}".document_uploads (filename, content_type, file_size, data) '
+                f'VALUES (:filename, :content_type, :file_size, :data) RETURNING id'
             ),
-            {"filename": file.filename, "content_text": content_text, "file_size": len(data)},
+            {"filename": file.filename or "document", "content_type": ct, "file_size": len(data), "data": bytes(data)},
+        )
+        job_id = result.scalar()
+        await tenant.commit()
+    finally:
+        await tenant.close()
+
+    extract_document.delay(ctx.schema_name, str(job_id))
+    return {"job_id": job_id, "status": "pending"}
+
+
+@router.get("/jobs/{job_id}")
+async def get_upload_job(
+    job_id: UUID,
+    ctx: OrgContext = Depends(require_admin),
+):
+    tenant = await get_tenant_session(ctx.schema_name)
+    try:
+        # extract_document bumps updated_at as it goes; a job that hasn't moved
+        # in DOCUMENT_JOB_STALE_SECONDS was lost and would otherwise never finish
+        await tenant.execute(
+            text(f"""
+                UPDATE "{ctx.schema_name}".document_uploads
+                SET status = 'failed', error = 'Processing timed out, please upload the file again',
+                    data = NULL, updated_at = NOW()
+                WHERE id = :id AND status IN ('pending', 'processing')
+                  AND updated_at < NOW() - make_interval(secs => :stale)
+            """),
+            {"id": job_id, "stale": settings.DOCUMENT_JOB_STALE_SECONDS},
         )
-        row = dict(result.fetchone()._mapping)
         await tenant.commit()
-        return row
+        result = await tenant.execute(
+            text(
+                f'SELECT id AS job_id, filename, file_size, status, progress, error, document_id, created_at, updated_at '
+                f'FROM "{ctx.schema_name}".document_uploads WHERE id = :id'
+            ),
+            {"id": job_id},
+        )
+        row = result.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Upload job not found")
+        return dict(row._mapping)
     finally:
         await tenant.close()
 
@@ -5,9 +5,10 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Optional
 
-from app.api.deps import require_admin, get_org_context
+from app.api.deps import require_admin, get_org_context, invalidate_org_context
 from app.schemas.schemas import OrgContext
 from app.core.database import get_db
+from app.services.prompts import invalidate_prompts
 from app.services.verticals import VERTICAL_LABELS
 
 router = APIRouter(prefix="/settings", tags=["settings"])
@@ -21,6 +22,7 @@ class OrgSettingsUpdate(BaseModel):
     theme: Optional[str] = None
     org_display_name: Optional[str] = None
     vertical: Optional[str] = None
+    speculative_filtering: Optional[bool] = None
 
 
 @router.get("/")
@@ -29,12 +31,12 @@ async def get_settings(
     db: AsyncSession = Depends(get_db),
 ):
     result = await db.execute(
-        text("SELECT theme, logo_base64, org_display_name, vertical FROM public.organizations WHERE clerk_org_id = :id"),
+        text("SELECT theme, logo_base64, org_display_name, vertical, speculative_filtering FROM public.organizations WHERE clerk_org_id = :id"),
         {"id": ctx.clerk_org_id},
     )
     row = result.fetchone()
     if not row:
-        return {"theme": "midnight", "has_logo": False, "org_display_name": None, "vertical": "general"}
+        return {"theme": "midnight", "has_logo": False, "org_display_name": None, "vertical": "general", "speculative_filtering": False}
     d = dict(row._mapping)
     d["has_logo"] = bool(d.pop("logo_base64", None))
     return d
@@ -77,6 +79,10 @@ async def update_settings(
         updates,
     )
     await db.commit()
+    if "speculative_filtering" in updates:
+        await invalidate_org_context(ctx.schema_name)
+    if "vertical" in updates:
+        await invalidate_prompts(ctx.schema_name)
     return {"ok": True}
 
 
@@ -0,0 +1,74 @@
+"""Shared Redis client and per-tenant version stamps for in-process caches.
+
+A version stamp is a random token rather than a counter: Redis runs without
+persistence, and a counter reset by a restart would hand out values that
+processes may still hold cached entries for. A missing stamp is replaced by a
+fresh token, so a restart invalidates every cache instead of reviving old ones.
+"""
+import time
+import uuid
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+
+_redis: aioredis.Redis | None = None
+
+# key -> version bumped by this process (used when Redis is unreachable)
+_local_versions: dict[str, str] = {}
+# key -> (version, fetched_at) so hot paths don't hit Redis on every call
+_version_memo: dict[str, tuple[str, float]] = {}
+
+
+def get_redis() -> aioredis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _redis
+
+
+def _version_key(namespace: str, schema: str) -> str:
+    return f"version:{namespace}:{schema}"
+
+
+def _new_token() -> str:
+    return uuid.uuid4().hex
+
+
+async def get_version(namespace: str, schema: str) -> str:
+    """Current version stamp for a tenant-scoped cache namespace.
+
+    The value is memoised for CACHE_VERSION_CHECK_SECONDS, so changes made by
+    other processes become visible within that window.
+    """
+    key = _version_key(namespace, schema)
+    memo = _version_memo.get(key)
+    if memo and time.monotonic() - memo[1] < settings.CACHE_VERSION_CHECK_SECONDS:
+        return memo[0]
+
+    try:
+        redis = get_redis()
+        version = await redis.get(key)
+        if version is None:
+            token = _new_token()
+            # Another process may initialise it at the same time; first one wins
+            version = token if await redis.set(key, token, nx=True) else await redis.get(key)
+    except RedisError:
+        version = None
+    if version is None:
+        version = _local_versions.get(key, "")
+    _version_memo[key] = (version, time.monotonic())
+    return version
+
+
+async def bump_version(namespace: str, schema: str) -> None:
+    """Invalidate every process's cached copy of (namespace, schema)."""
+    key = _version_key(namespace, schema)
+    token = _new_token()
+    _local_versions[key] = token
+    _version_memo.pop(key, None)
+    try:
+        await get_redis().set(key, token)
+    except RedisError:
+        pass
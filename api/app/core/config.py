@@ -14,11 +14,98 @@ class Settings(BaseSettings):
 
     OLLAMA_URL: str = "http://ollama:11434"
     OLLAMA_MODEL: str = "llama3.2"
+    # Document embeddings for retrieval; org_document_chunks.embedding is
+    # vector(768), so a model with another dimension needs a migration
+    OLLAMA_EMBED_MODEL: str = "nomic-embed-text"
+    RAG_CHUNK_CHARS: int = 1200
+    RAG_CHUNK_OVERLAP: int = 200
+    RAG_TOP_K: int = 4
+    # Chat turns skip document context rather than wait longer on the query embedding
+    RAG_EMBED_TIMEOUT_SECONDS: float = 2.0
+    # Upload jobs with no progress for this long (worker down, message lost)
+    # are reported as failed by GET /admin/documents/jobs/{id}
+    DOCUMENT_JOB_STALE_SECONDS: int = 300
+    SEMANTIC_VERDICT_TTL_SECONDS: int = 3600
+
+    # Presidio NER runs in a process pool; each worker holds its own spaCy
+    # model (~800 MB RSS with en_core_web_lg). One worker fits the default 1 GB
+    # API task, but then every scan queues behind the one in flight: give the
+    # task ~1 GB and a vCPU per extra worker and raise this for NER-heavy tenants.
+    PRESIDIO_WORKERS: int = 1
+    PRESIDIO_BATCH_SIZE: int = 16
+    PRESIDIO_BATCH_WINDOW_MS: float = 5.0
+    # A batch is flushed once it holds this many characters; texts at least
+    # SOLO_CHARS long are analysed alone instead of joining a batch
+    PRESIDIO_BATCH_MAX_CHARS: int = 8000
+    PRESIDIO_SOLO_CHARS: int = 4000
+    # A scan not back in time is treated as failed (the PII rule then falls
+    # back to no NER hit, as for any other Presidio error)
+    PRESIDIO_TIMEOUT_SECONDS: float = 10.0
+    # Total characters (text + redaction) kept in the NER result LRU
+    PRESIDIO_CACHE_MAX_CHARS: int = 20_000_000
+
+    # Shared upstream (OpenAI / Anthropic / Gemini) HTTP client pools
+    PROVIDER_HTTP2: bool = True
+    PROVIDER_MAX_CONNECTIONS: int = 100
+    PROVIDER_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    PROVIDER_KEEPALIVE_SECONDS: float = 60.0
+    PROVIDER_CONNECT_TIMEOUT: float = 10.0
+    PROVIDER_READ_TIMEOUT: float = 60.0
+    PROVIDER_WRITE_TIMEOUT: float = 30.0
+    PROVIDER_POOL_TIMEOUT: float = 10.0
+    # Decrypted provider connections cached per tenant (also invalidated on edit)
+    CONNECTION_CACHE_TTL_SECONDS: float = 300.0
 
     APP_ENV: str = "development"
 
     CORS_ORIGINS: str = "http://localhost:3000"
 
+    # Postgres connections kept open by each Celery worker process
+    WORKER_DB_POOL_SIZE: int = 2
+
+    # Buffered analytics_events: flush when a tenant's buffer reaches the batch
+    # size, and on the beat interval otherwise
+    ANALYTICS_FLUSH_BATCH_SIZE: int = 500
+    ANALYTICS_FLUSH_INTERVAL_SECONDS: float = 5.0
+    ANALYTICS_FLUSH_MAX_BATCHES: int = 20
+    # Daily rollups behind /analytics/summary are refreshed on this interval
+    ANALYTICS_ROLLUP_INTERVAL_SECONDS: float = 60.0
+    ANALYTICS_ROLLUP_MAX_SCHEMAS: int = 1000
+    # /analytics/summary responses: served fresh for FRESH seconds, then served
+    # stale for up to STALE more seconds while one request recomputes them
+    SUMMARY_CACHE_FRESH_SECONDS: float = 30.0
+    SUMMARY_CACHE_STALE_SECONDS: float = 300.0
+    # Chat history sent upstream: the messages after the session's rolling
+    # summary, within both limits. When the window is about to fill, the worker
+    # folds all but the newest MAX_MESSAGES - SUMMARY_BATCH into the summary
+    # (at most SUMMARY_MAX per run).
+    CHAT_HISTORY_MAX_MESSAGES: int = 20
+    CHAT_HISTORY_MAX_TOKENS: int = 8000
+    CHAT_SUMMARY_BATCH_MESSAGES: int = 10
+    CHAT_SUMMARY_MAX_MESSAGES: int = 200
+
+    # Cached system prompt prefixes (agent + vertical), also invalidated on edit
+    PROMPT_CACHE_TTL_SECONDS: float = 300.0
+    PROMPT_CACHE_MAX_USERS: int = 10_000
+
+    # Rows fetched per server-side cursor round-trip by /analytics/export
+    EXPORT_BATCH_ROWS: int = 2000
+
+    # How long a process trusts its memoised cache version stamps before
+    # re-reading them from Redis (bounds cross-process staleness).
+    CACHE_VERSION_CHECK_SECONDS: float = 2.0
+
+    # Clerk JWT verification
+    JWKS_REFRESH_SECONDS: float = 600.0
+    JWKS_MIN_REFRESH_SECONDS: float = 30.0
+    JWT_CLAIMS_CACHE_MAX_SECONDS: float = 300.0
+    JWT_CLAIMS_CACHE_MAX_ENTRIES: int = 50_000
+
+    # Resolved OrgContext per (user, org): process-local LRU in front of Redis
+    ORG_CONTEXT_LOCAL_TTL_SECONDS: float = 60.0
+    ORG_CONTEXT_LOCAL_MAX_ENTRIES: int = 10_000
+    ORG_CONTEXT_REDIS_TTL_SECONDS: int = 600
+
     class Config:
         env_file = ".env"
 
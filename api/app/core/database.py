@@ -1,10 +1,37 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.pool import NullPool
-from sqlalchemy import text
+from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+from sqlalchemy import event, text
+from app.core import metrics
 from app.core.config import settings
 
+
+class TenantSession(Session):
+    """Session that puts its connections on the tenant schema named in info["search_path"]."""
+
+
+@event.listens_for(TenantSession, "after_begin")
+def _apply_search_path(session, transaction, connection):
+    schema = session.info.get("search_path")
+    if schema is None:
+        return
+    # The pooled connection remembers which path it was last given, so a
+    # checkout that lands on the same tenant skips the round-trip.
+    pooled = connection.connection
+    if pooled.info.get("search_path") == schema:
+        metrics.incr("search_path.skipped")
+        return
+    # Sent on the driver connection before asyncpg opens the transaction, so
+    # the SET is autocommitted and survives a later rollback.
+    await_only(pooled.driver_connection.execute(f'SET search_path TO "{schema}", public'))
+    pooled.info["search_path"] = schema
+    metrics.incr("search_path.set")
+
+
 engine = create_async_engine(settings.DATABASE_URL, echo=False, pool_size=20, max_overflow=10)
-AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+AsyncSessionLocal = async_sessionmaker(
+    engine, class_=AsyncSession, sync_session_class=TenantSession, expire_on_commit=False,
+)
 
 
 async def get_db():
@@ -13,18 +40,46 @@ async def get_db():
 
 
 async def get_tenant_session(org_schema: str) -> AsyncSession:
-    session = AsyncSessionLocal()
-    await session.execute(text(f'SET search_path TO "{org_schema}", public'))
-    return session
+    return AsyncSessionLocal(info={"search_path": org_schema})
+
+
+# ── Celery worker engine ───────────────────────────────────────────────────
+# One pooled engine per worker process, created after the prefork fork by
+# init_task_engine() (worker_process_init) and disposed on shutdown.
+
+_task_engine = None
+_task_sessionmaker: async_sessionmaker | None = None
+
+
+def init_task_engine() -> None:
+    global _task_engine, _task_sessionmaker
+    if _task_engine is not None:
+        # Inherited across fork: drop the parent's pool without closing its sockets
+        _task_engine.sync_engine.dispose(close=False)
+    _task_engine = create_async_engine(
+        settings.DATABASE_URL,
+        pool_size=settings.WORKER_DB_POOL_SIZE,
+        max_overflow=0,
+        pool_pre_ping=True,
+    )
+    _task_sessionmaker = async_sessionmaker(
+        _task_engine, class_=AsyncSession, sync_session_class=TenantSession, expire_on_commit=False,
+    )
+
+
+async def dispose_task_engine() -> None:
+    global _task_engine, _task_sessionmaker
+    if _task_engine is not None:
+        await _task_engine.dispose()
+    _task_engine = None
+    _task_sessionmaker = None
 
 
 async def get_task_session(org_schema: str) -> AsyncSession:
-    """Fork-safe session for Celery tasks: uses NullPool so no connections are shared across processes."""
-    task_engine = create_async_engine(settings.DATABASE_URL, poolclass=NullPool)
-    factory = async_sessionmaker(task_engine, class_=AsyncSession, expire_on_commit=False)
-    session = factory()
-    await session.execute(text(f'SET search_path TO "{org_schema}", public'))
-    return session
+    """Session for Celery tasks, from the calling worker process's own pool."""
+    if _task_sessionmaker is None:
+        init_task_engine()
+    return _task_sessionmaker(info={"search_path": org_schema})
 
 
 # SQL to provision a new org schema with all required tables
@@ -44,6 +99,11 @@ CREATE TABLE IF NOT EXISTS "{schema}".sessions (
     user_id UUID NOT NULL REFERENCES "{schema}".users(id) ON DELETE CASCADE,
     title TEXT,
     gpt_target TEXT NOT NULL DEFAULT 'openai',
+    message_count INTEGER NOT NULL DEFAULT 0,
+    blocked_count INTEGER NOT NULL DEFAULT 0,
+    summary TEXT,
+    summary_through TIMESTAMPTZ,
+    summary_message_count INTEGER NOT NULL DEFAULT 0,
     created_at TIMESTAMPTZ DEFAULT NOW(),
     updated_at TIMESTAMPTZ DEFAULT NOW()
 );
@@ -57,6 +117,7 @@ CREATE TABLE IF NOT EXISTS "{schema}".messages (
     block_reason TEXT,
     gpt_target TEXT,
     tokens_used INTEGER,
+    cached_tokens INTEGER,
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
@@ -127,13 +188,65 @@ CREATE TABLE IF NOT EXISTS "{schema}".invitations (
     invited_at TIMESTAMPTZ DEFAULT NOW()
 );
 
+CREATE TABLE IF NOT EXISTS "{schema}".daily_message_stats (
+    day DATE NOT NULL,
+    gpt_target TEXT NOT NULL DEFAULT '',
+    block_reason TEXT NOT NULL DEFAULT '',
+    total INTEGER NOT NULL,
+    blocked INTEGER NOT NULL,
+    PRIMARY KEY (day, gpt_target, block_reason)
+);
+
+CREATE TABLE IF NOT EXISTS "{schema}".daily_activity (
+    day DATE NOT NULL,
+    session_id UUID NOT NULL,
+    user_id UUID NOT NULL,
+    PRIMARY KEY (day, session_id)
+);
+
+CREATE TABLE IF NOT EXISTS "{schema}".rollup_state (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    refreshed_through DATE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS "{schema}".document_uploads (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    filename TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    file_size INTEGER NOT NULL,
+    data BYTEA,
+    status TEXT NOT NULL DEFAULT 'pending',
+    progress INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    document_id UUID REFERENCES "{schema}".org_documents(id) ON DELETE SET NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS "{schema}".org_document_chunks (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    document_id UUID NOT NULL REFERENCES "{schema}".org_documents(id) ON DELETE CASCADE,
+    chunk_index INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    embedding vector(768) NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
 CREATE INDEX IF NOT EXISTS analytics_created_at_{schema} ON "{schema}".analytics_events(created_at);
 CREATE INDEX IF NOT EXISTS messages_session_id_{schema} ON "{schema}".messages(session_id);
+CREATE INDEX IF NOT EXISTS messages_session_created_{schema} ON "{schema}".messages(session_id, created_at);
+CREATE INDEX IF NOT EXISTS messages_created_at_{schema} ON "{schema}".messages(created_at);
 CREATE INDEX IF NOT EXISTS sessions_user_id_{schema} ON "{schema}".sessions(user_id);
+CREATE INDEX IF NOT EXISTS doc_chunks_document_id_{schema} ON "{schema}".org_document_chunks(document_id);
+CREATE INDEX IF NOT EXISTS doc_chunks_embedding_{schema} ON "{schema}".org_document_chunks
+    USING hnsw (embedding vector_cosine_ops);
+CREATE INDEX IF NOT EXISTS sessions_updated_at_{schema} ON "{schema}".sessions(updated_at DESC, id DESC)
+    INCLUDE (user_id, title, gpt_target, message_count, blocked_count, created_at);
 """
 
 PUBLIC_SCHEMA_SQL = """
 CREATE EXTENSION IF NOT EXISTS "pgcrypto";
+CREATE EXTENSION IF NOT EXISTS vector;
 
 CREATE TABLE IF NOT EXISTS public.organizations (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -150,6 +263,7 @@ ALTER TABLE public.organizations ADD COLUMN IF NOT EXISTS theme TEXT NOT NULL DE
 ALTER TABLE public.organizations ADD COLUMN IF NOT EXISTS logo_base64 TEXT;
 ALTER TABLE public.organizations ADD COLUMN IF NOT EXISTS org_display_name TEXT;
 ALTER TABLE public.organizations ADD COLUMN IF NOT EXISTS vertical TEXT NOT NULL DEFAULT 'general';
+ALTER TABLE public.organizations ADD COLUMN IF NOT EXISTS speculative_filtering BOOLEAN NOT NULL DEFAULT FALSE;
 """
 
 
@@ -212,6 +326,106 @@ async def _migrate_existing_schemas(conn):
                 invited_at TIMESTAMPTZ DEFAULT NOW()
             )
         """))
+        # Daily analytics rollups (filled by the refresh_rollups task)
+        await conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS "{schema}".daily_message_stats (
+                day DATE NOT NULL,
+                gpt_target TEXT NOT NULL DEFAULT '',
+                block_reason TEXT NOT NULL DEFAULT '',
+                total INTEGER NOT NULL,
+                blocked INTEGER NOT NULL,
+                PRIMARY KEY (day, gpt_target, block_reason)
+            )
+        """))
+        await conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS "{schema}".daily_activity (
+                day DATE NOT NULL,
+                session_id UUID NOT NULL,
+                user_id UUID NOT NULL,
+                PRIMARY KEY (day, session_id)
+            )
+        """))
+        await conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS "{schema}".rollup_state (
+                id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                refreshed_through DATE NOT NULL
+            )
+        """))
+        await conn.execute(text(
+            f'CREATE INDEX IF NOT EXISTS messages_created_at_{schema} ON "{schema}".messages(created_at)'
+        ))
+        # Per-session message counters, backfilled once when the columns are added
+        has_counters = await conn.execute(text("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = :schema AND table_name = 'sessions' AND column_name = 'message_count'
+        """), {"schema": schema})
+        if has_counters.scalar() is None:
+            await conn.execute(text(f"""
+                ALTER TABLE "{schema}".sessions
+                    ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0,
+                    ADD COLUMN blocked_count INTEGER NOT NULL DEFAULT 0
+            """))
+            await conn.execute(text(f"""
+                UPDATE "{schema}".sessions s
+                SET message_count = c.total, blocked_count = c.blocked
+                FROM (
+                    SELECT session_id, COUNT(*) AS total, COUNT(*) FILTER (WHERE was_blocked) AS blocked
+                    FROM "{schema}".messages GROUP BY session_id
+                ) c
+                WHERE c.session_id = s.id
+            """))
+        # Staged uploads for the extract_document task
+        await conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS "{schema}".document_uploads (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                filename TEXT NOT NULL,
+                content_type TEXT NOT NULL,
+                file_size INTEGER NOT NULL,
+                data BYTEA,
+                status TEXT NOT NULL DEFAULT 'pending',
+                progress INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                document_id UUID REFERENCES "{schema}".org_documents(id) ON DELETE SET NULL,
+                created_at TIMESTAMPTZ DEFAULT NOW(),
+                updated_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        """))
+        # Embedded document chunks for retrieval (filled by the embed_document task)
+        await conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS "{schema}".org_document_chunks (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                document_id UUID NOT NULL REFERENCES "{schema}".org_documents(id) ON DELETE CASCADE,
+                chunk_index INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                embedding vector(768) NOT NULL,
+                created_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        """))
+        await conn.execute(text(
+            f'CREATE INDEX IF NOT EXISTS doc_chunks_document_id_{schema} ON "{schema}".org_document_chunks(document_id)'
+        ))
+        await conn.execute(text(
+            f'CREATE INDEX IF NOT EXISTS doc_chunks_embedding_{schema} ON "{schema}".org_document_chunks '
+            f'USING hnsw (embedding vector_cosine_ops)'
+        ))
+        # Rolling conversation summary for the windowed chat history
+        await conn.execute(text(f"""
+            ALTER TABLE "{schema}".sessions
+                ADD COLUMN IF NOT EXISTS summary TEXT,
+                ADD COLUMN IF NOT EXISTS summary_through TIMESTAMPTZ,
+                ADD COLUMN IF NOT EXISTS summary_message_count INTEGER NOT NULL DEFAULT 0
+        """))
+        await conn.execute(text(
+            f'CREATE INDEX IF NOT EXISTS messages_session_created_{schema} ON "{schema}".messages(session_id, created_at)'
+        ))
+        await conn.execute(text(f"""
+            CREATE INDEX IF NOT EXISTS sessions_updated_at_{schema} ON "{schema}".sessions(updated_at DESC, id DESC)
+                INCLUDE (user_id, title, gpt_target, message_count, blocked_count, created_at)
+        """))
+        # Provider prompt-cache hits per assistant reply
+        await conn.execute(text(
+            f'ALTER TABLE "{schema}".messages ADD COLUMN IF NOT EXISTS cached_tokens INTEGER'
+        ))
 
 
 async def init_db():
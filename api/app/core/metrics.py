@@ -0,0 +1,37 @@
+"""In-process counters exposed at GET /metrics (org admins only).
+
+Counters are per process (each uvicorn / celery worker reports its own).
+For every "<name>.hits" counter the snapshot also reports "<name>.hit_rate"
+against the matching "<name>.misses". Timings recorded with observe() are
+reported as "<name>.count", "<name>.avg_ms" and "<name>.max_ms".
+"""
+from collections import defaultdict
+
+_counters: dict[str, float] = defaultdict(float)
+_timings: dict[str, list[float]] = {}  # name -> [count, total_ms, max_ms]
+
+
+def incr(name: str, value: float = 1) -> None:
+    _counters[name] += value
+
+
+def observe(name: str, seconds: float) -> None:
+    ms = seconds * 1000
+    timing = _timings.setdefault(name, [0, 0.0, 0.0])
+    timing[0] += 1
+    timing[1] += ms
+    timing[2] = max(timing[2], ms)
+
+
+def snapshot() -> dict[str, float]:
+    out = dict(sorted(_counters.items()))
+    for name, hits in list(out.items()):
+        if name.endswith(".hits"):
+            base = name[: -len(".hits")]
+            total = hits + out.get(f"{base}.misses", 0)
+            out[f"{base}.hit_rate"] = round(hits / total, 4) if total else 0.0
+    for name, (count, total_ms, max_ms) in sorted(_timings.items()):
+        out[f"{name}.count"] = count
+        out[f"{name}.avg_ms"] = round(total_ms / count, 2)
+        out[f"{name}.max_ms"] = round(max_ms, 2)
+    return out
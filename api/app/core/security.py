@@ -1,7 +1,9 @@
+import functools
 from cryptography.fernet import Fernet
 from app.core.config import settings
 
 
+@functools.lru_cache(maxsize=1)
 def _get_fernet() -> Fernet:
     key = settings.ENCRYPTION_KEY
     if not key:
@@ -1,15 +1,26 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.core.database import init_db
 from app.core.config import settings as app_settings
+from app.core import metrics
+from app.api.deps import jwks_refresh_loop, require_admin
+from app.services.presidio_executor import presidio_executor
+from app.services.proxy import open_provider_clients, close_provider_clients
 from app.api.routes import auth, chat, admin, analytics, settings, documents, invitations
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    presidio_executor.start()
+    open_provider_clients()
+    jwks_refresher = asyncio.create_task(jwks_refresh_loop())
     yield
+    jwks_refresher.cancel()
+    await close_provider_clients()
+    presidio_executor.shutdown()
 
 
 app = FastAPI(title="AI Gateway", version="1.0.0", lifespan=lifespan)
@@ -34,3 +45,8 @@ app.include_router(invitations.router)
 @app.get("/health")
 async def health():
     return {"status": "ok"}
+
+
+@app.get("/metrics", dependencies=[Depends(require_admin)])
+async def get_metrics():
+    return metrics.snapshot()
@@ -13,6 +13,8 @@ class OrgContext(BaseModel):
     user_clerk_id: str
     user_id: UUID
     user_role: str
+    # Run semantic filtering concurrently with the upstream request
+    speculative_filtering: bool = False
 
 
 # ── Chat ───────────────────────────────────────────────────────────────────
@@ -1,6 +1,14 @@
+import asyncio
+import json
+import time
+from redis.exceptions import RedisError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from uuid import UUID
+from app.core import metrics
+from app.core.cache import get_redis
+from app.core.config import settings
+from app.core.database import get_tenant_session
 
 
 async def record_event(
@@ -25,50 +33,159 @@ async def record_event(
     await session.commit()
 
 
-async def get_summary(session: AsyncSession, days: int = 30) -> dict:
-    total = await session.execute(
-        text("SELECT COUNT(*) FROM messages WHERE created_at > NOW() - INTERVAL ':days days'".replace(":days", str(days)))
-    )
-    blocked = await session.execute(
-        text(f"SELECT COUNT(*) FROM messages WHERE was_blocked = TRUE AND created_at > NOW() - INTERVAL '{days} days'")
-    )
-    active_sessions = await session.execute(
-        text(f"SELECT COUNT(DISTINCT id) FROM sessions WHERE updated_at > NOW() - INTERVAL '{days} days'")
-    )
-    active_users = await session.execute(
-        text(f"SELECT COUNT(DISTINCT user_id) FROM sessions WHERE updated_at > NOW() - INTERVAL '{days} days'")
-    )
-    by_provider = await session.execute(
-        text(f"SELECT gpt_target, COUNT(*) as count FROM messages WHERE created_at > NOW() - INTERVAL '{days} days' GROUP BY gpt_target")
-    )
-    by_day = await session.execute(
-        text(f"""
-            SELECT DATE(created_at) as day, COUNT(*) as total,
-                   SUM(CASE WHEN was_blocked THEN 1 ELSE 0 END) as blocked
+async def refresh_daily_rollups(session: AsyncSession) -> None:
+    """Recompute the daily rollups for the session's tenant; caller commits.
+
+    Days from the day before the last refresh onwards are rebuilt from
+    messages, which picks up late updates such as messages blocked after the
+    speculative semantic check. The first run backfills the full history.
+    """
+    # Serialise concurrent refreshes of the same tenant
+    await session.execute(text("SELECT pg_advisory_xact_lock(hashtext(current_schema()))"))
+    result = await session.execute(text("""
+        SELECT COALESCE(
+            (SELECT refreshed_through - 1 FROM rollup_state),
+            (SELECT MIN(created_at)::date FROM messages),
+            CURRENT_DATE
+        )
+    """))
+    since = result.scalar()
+
+    await session.execute(text("DELETE FROM daily_message_stats WHERE day >= :since"), {"since": since})
+    await session.execute(
+        text("""
+            INSERT INTO daily_message_stats (day, gpt_target, block_reason, total, blocked)
+            SELECT created_at::date, COALESCE(gpt_target, ''), COALESCE(block_reason, ''),
+                   COUNT(*), COUNT(*) FILTER (WHERE was_blocked)
             FROM messages
-            WHERE created_at > NOW() - INTERVAL '{days} days'
-            GROUP BY DATE(created_at)
-            ORDER BY day
-        """)
+            WHERE created_at >= CAST(:since AS date)
+            GROUP BY 1, 2, 3
+        """),
+        {"since": since},
     )
-    top_blocked = await session.execute(
-        text(f"""
-            SELECT block_reason, COUNT(*) as count
-            FROM messages
-            WHERE was_blocked = TRUE AND block_reason IS NOT NULL
-              AND created_at > NOW() - INTERVAL '{days} days'
-            GROUP BY block_reason
-            ORDER BY count DESC
-            LIMIT 10
-        """)
+    await session.execute(text("DELETE FROM daily_activity WHERE day >= :since"), {"since": since})
+    await session.execute(
+        text("""
+            INSERT INTO daily_activity (day, session_id, user_id)
+            SELECT DISTINCT m.created_at::date, m.session_id, s.user_id
+            FROM messages m
+            JOIN sessions s ON s.id = m.session_id
+            WHERE m.created_at >= CAST(:since AS date)
+        """),
+        {"since": since},
     )
+    await session.execute(text("""
+        INSERT INTO rollup_state (id, refreshed_through) VALUES (TRUE, CURRENT_DATE)
+        ON CONFLICT (id) DO UPDATE SET refreshed_through = EXCLUDED.refreshed_through
+    """))
+
+
+_SUMMARY_SQL = text("""
+    WITH stats AS (
+        SELECT day, gpt_target, block_reason, total, blocked
+        FROM daily_message_stats
+        WHERE day >= CURRENT_DATE - CAST(:days AS integer)
+    ),
+    activity AS (
+        SELECT COUNT(DISTINCT session_id) AS sessions, COUNT(DISTINCT user_id) AS users
+        FROM daily_activity
+        WHERE day >= CURRENT_DATE - CAST(:days AS integer)
+    ),
+    by_day AS (
+        SELECT day, SUM(total) AS total, SUM(blocked) AS blocked
+        FROM stats GROUP BY day
+    ),
+    by_provider AS (
+        SELECT gpt_target, SUM(total) AS total
+        FROM stats GROUP BY gpt_target
+    ),
+    by_reason AS (
+        SELECT block_reason, SUM(blocked) AS count
+        FROM stats WHERE block_reason <> '' AND blocked > 0
+        GROUP BY block_reason ORDER BY count DESC LIMIT 10
+    )
+    SELECT
+        EXISTS (SELECT 1 FROM rollup_state) AS rolled_up,
+        (SELECT COALESCE(SUM(total), 0) FROM stats) AS total_messages,
+        (SELECT COALESCE(SUM(blocked), 0) FROM stats) AS blocked_messages,
+        activity.sessions AS active_sessions,
+        activity.users AS active_users,
+        (SELECT COALESCE(json_agg(json_build_array(NULLIF(gpt_target, ''), total)), '[]') FROM by_provider) AS by_provider,
+        (SELECT COALESCE(json_agg(json_build_object('day', day::text, 'total', total, 'blocked', blocked) ORDER BY day), '[]') FROM by_day) AS by_day,
+        (SELECT COALESCE(json_agg(json_build_object('reason', block_reason, 'count', count) ORDER BY count DESC), '[]') FROM by_reason) AS top_blocked
+    FROM activity
+""")
+
+
+async def get_summary(session: AsyncSession, days: int = 30) -> dict:
+    """Dashboard summary read from the daily rollups in one round-trip (day granularity)."""
+    row = (await session.execute(_SUMMARY_SQL, {"days": days})).one()
+    if not row.rolled_up:
+        # Tenant not rolled up yet: backfill once inline
+        await refresh_daily_rollups(session)
+        await session.commit()
+        row = (await session.execute(_SUMMARY_SQL, {"days": days})).one()
 
     return {
-        "total_messages": total.scalar() or 0,
-        "blocked_messages": blocked.scalar() or 0,
-        "active_sessions": active_sessions.scalar() or 0,
-        "active_users": active_users.scalar() or 0,
-        "messages_by_provider": {row.gpt_target: row.count for row in by_provider},
-        "messages_by_day": [{"day": str(row.day), "total": row.total, "blocked": row.blocked} for row in by_day],
-        "top_blocked_rules": [{"reason": row.block_reason, "count": row.count} for row in top_blocked],
+        "total_messages": int(row.total_messages),
+        "blocked_messages": int(row.blocked_messages),
+        "active_sessions": row.active_sessions,
+        "active_users": row.active_users,
+        "messages_by_provider": {provider: int(total) for provider, total in row.by_provider},
+        "messages_by_day": row.by_day,
+        "top_blocked_rules": row.top_blocked,
     }
+
+
+# ── Summary cache ──────────────────────────────────────────────────────────
+# JSON summaries per (schema, days) in Redis. Fresh entries are served as-is;
+# stale ones are served while one request (per Redis lock) recomputes them in
+# the background.
+
+_refreshes: set[asyncio.Task] = set()
+
+
+def _summary_key(schema: str, days: int) -> str:
+    return f"analytics_summary:{schema}:{days}"
+
+
+async def _compute_and_cache_summary(schema: str, days: int) -> dict:
+    session = await get_tenant_session(schema)
+    try:
+        summary = await get_summary(session, days)
+    finally:
+        await session.close()
+    entry = json.dumps({"computed_at": time.time(), "summary": summary})
+    try:
+        await get_redis().set(
+            _summary_key(schema, days), entry,
+            ex=int(settings.SUMMARY_CACHE_FRESH_SECONDS + settings.SUMMARY_CACHE_STALE_SECONDS),
+        )
+    except RedisError:
+        pass
+    return summary
+
+
+async def get_cached_summary(schema: str, days: int = 30) -> dict:
+    key = _summary_key(schema, days)
+    try:
+        raw = await get_redis().get(key)
+    except RedisError:
+        raw = None
+    if not raw:
+        metrics.incr("summary_cache.misses")
+        return await _compute_and_cache_summary(schema, days)
+
+    entry = json.loads(raw)
+    metrics.incr("summary_cache.hits")
+    if time.time() - entry["computed_at"] > settings.SUMMARY_CACHE_FRESH_SECONDS:
+        try:
+            claimed = await get_redis().set(f"{key}:refreshing", 1, nx=True, ex=30)
+        except RedisError:
+            claimed = False
+        if claimed:
+            metrics.incr("summary_cache.revalidations")
+            task = asyncio.create_task(_compute_and_cache_summary(schema, days))
+            _refreshes.add(task)
+            task.add_done_callback(_refreshes.discard)
+    return entry["summary"]
@@ -0,0 +1,116 @@
+"""Buffered analytics_events ingestion.
+
+Request handlers append events to a per-schema Redis list instead of queueing
+one Celery task per event. A flush task drains each list in batches with a
+single multi-row INSERT; it is triggered when a buffer reaches
+ANALYTICS_FLUSH_BATCH_SIZE and by the beat schedule every
+ANALYTICS_FLUSH_INTERVAL_SECONDS.
+"""
+import json
+import time
+from typing import Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import metrics
+from app.core.cache import get_redis
+from app.core.config import settings
+from app.workers.celery_app import celery_app
+
+SCHEMAS_KEY = "analytics_buffer:schemas"
+# Tenants with chat activity since their daily rollups were last refreshed
+ROLLUP_DIRTY_KEY = "analytics_rollup:dirty"
+
+
+def _buffer_key(schema: str) -> str:
+    return f"analytics_buffer:{schema}"
+
+
+def make_event(event_type: str, user_id: Optional[str], session_id: Optional[str], metadata: dict) -> dict:
+    return {
+        "event_type": event_type,
+        "user_id": user_id,
+        "session_id": session_id,
+        "metadata": metadata,
+        "ts": time.time(),
+    }
+
+
+async def record_event(
+    schema: str, event_type: str, user_id: Optional[str], session_id: Optional[str], metadata: dict,
+) -> None:
+    """Queue an analytics event; never raises into the request that produced it."""
+    event = json.dumps(make_event(event_type, user_id, session_id, metadata))
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            pipe.rpush(_buffer_key(schema), event)
+            pipe.sadd(SCHEMAS_KEY, schema)
+            pipe.sadd(ROLLUP_DIRTY_KEY, schema)
+            length, _, _ = await pipe.execute()
+    except RedisError:
+        metrics.incr("analytics.dropped")
+        return
+
+    metrics.incr("analytics.buffered")
+    # Exactly one push crosses the threshold, so one flush is queued per batch
+    if length == settings.ANALYTICS_FLUSH_BATCH_SIZE:
+        celery_app.send_task("app.workers.tasks.flush_analytics", args=[schema])
+
+
+async def insert_events(session: AsyncSession, schema: str, events: list[dict]) -> None:
+    """Write events with one INSERT ... SELECT FROM unnest(...); caller commits."""
+    if not events:
+        return
+    await session.execute(
+        text(f"""
+            INSERT INTO "{schema}".analytics_events (event_type, user_id, session_id, metadata, created_at)
+            SELECT e.event_type, e.user_id, e.session_id, e.metadata, to_timestamp(e.ts)
+            FROM unnest(
+                CAST(:event_types AS text[]), CAST(:user_ids AS uuid[]), CAST(:session_ids AS uuid[]),
+                CAST(:metadata AS jsonb[]), CAST(:ts AS float8[])
+            ) AS e(event_type, user_id, session_id, metadata, ts)
+        """),
+        {
+            "event_types": [e["event_type"] for e in events],
+            "user_ids": [e["user_id"] for e in events],
+            "session_ids": [e["session_id"] for e in events],
+            "metadata": [json.dumps(e["metadata"]) for e in events],
+            "ts": [float(e["ts"]) for e in events],
+        },
+    )
+
+
+async def take_batch(schema: str) -> list[str]:
+    """Atomically pop up to one batch of raw events from the schema's buffer."""
+    return await get_redis().lpop(_buffer_key(schema), settings.ANALYTICS_FLUSH_BATCH_SIZE) or []
+
+
+async def requeue(schema: str, raw: list[str]) -> None:
+    """Put events back after a failed write so the next flush retries them."""
+    async with get_redis().pipeline(transaction=False) as pipe:
+        pipe.rpush(_buffer_key(schema), *raw)
+        pipe.sadd(SCHEMAS_KEY, schema)
+        await pipe.execute()
+
+
+async def buffered_schemas() -> list[str]:
+    return list(await get_redis().smembers(SCHEMAS_KEY))
+
+
+async def take_dirty_rollups() -> list[str]:
+    """Claim every tenant whose rollups need refreshing; new activity re-marks it."""
+    return list(await get_redis().spop(ROLLUP_DIRTY_KEY, settings.ANALYTICS_ROLLUP_MAX_SCHEMAS) or [])
+
+
+async def mark_rollup_dirty(schema: str) -> None:
+    await get_redis().sadd(ROLLUP_DIRTY_KEY, schema)
+
+
+async def forget_if_empty(schema: str) -> None:
+    redis = get_redis()
+    await redis.srem(SCHEMAS_KEY, schema)
+    # record_event may have pushed between the flush and the SREM
+    if await redis.llen(_buffer_key(schema)):
+        await redis.sadd(SCHEMAS_KEY, schema)
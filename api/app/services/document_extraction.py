@@ -0,0 +1,42 @@
+"""Plain-text extraction for uploaded org documents.
+
+Runs in the worker (extract_document task). Text is produced one page (PDF)
+or paragraph block (DOCX, text) at a time so the task can report progress.
+"""
+import io
+from typing import Iterator
+
+PDF = "application/pdf"
+DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Paragraphs per progress step for DOCX files
+DOCX_BLOCK = 200
+
+
+class ExtractionError(ValueError):
+    pass
+
+
+def iter_text(data: bytes, content_type: str) -> tuple[int, Iterator[str], str]:
+    """Return (number of parts, iterator over each part's text, separator to join them)."""
+    if content_type == PDF:
+        try:
+            from pypdf import PdfReader
+            reader = PdfReader(io.BytesIO(data))
+            pages = reader.pages
+            total = len(pages)
+        except Exception as e:
+            raise ExtractionError(f"Could not parse PDF: {e}")
+        return total, (page.extract_text() or "" for page in pages), "\n\n"
+
+    if content_type == DOCX:
+        try:
+            from docx import Document
+            paragraphs = [p.text for p in Document(io.BytesIO(data)).paragraphs if p.text.strip()]
+        except Exception as e:
+            raise ExtractionError(f"Could not parse DOCX: {e}")
+        blocks = range(0, len(paragraphs), DOCX_BLOCK)
+        return len(blocks), ("\n".join(paragraphs[i:i + DOCX_BLOCK]) for i in blocks), "\n"
+
+    # Plain text / markdown / CSV
+    return 1, iter([data.decode("utf-8", errors="replace")]), ""
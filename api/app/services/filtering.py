@@ -1,9 +1,13 @@
+import functools
 import re
 from dataclasses import dataclass
 from typing import Optional, Literal
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
+from app.core.cache import get_version, bump_version
+from app.services.keyword_matcher import KeywordMatcher
 from app.services.llm import llm_service
+from app.services.presidio_executor import presidio_executor
 
 
 @dataclass
@@ -11,6 +15,9 @@ class FilterResult:
     action: Literal["allow", "block", "modify"]
     reason: Optional[str] = None
     modified_content: Optional[str] = None
+    # Set when evaluate() skipped semantic rules (defer_semantic=True); the
+    # caller must still run evaluate_semantic() on them before trusting "allow".
+    pending_semantic_rules: Optional[list[dict]] = None
 
 
 # ── Built-in fast regex PII patterns ──────────────────────────────────────
@@ -34,106 +41,260 @@ _PII_PATTERNS: list[tuple[str, re.Pattern]] = [
 _PII_LABEL_MAP = {label.lower(): pat for label, pat in _PII_PATTERNS}
 
 
-def _detect_pii_regex(content: str, requested_types: str) -> Optional[str]:
-    """Fast regex pass. Returns reason string or None."""
+def _resolve_pii_patterns(requested_types: str) -> list[tuple[str, re.Pattern]]:
+    """Map a rule's pattern ("ALL" or comma-separated labels) to regex patterns."""
     if requested_types.strip().upper() == "ALL":
-        patterns = _PII_PATTERNS
-    else:
-        types = [t.strip().lower() for t in requested_types.split(",")]
-        patterns = [(lbl, pat) for lbl, pat in _PII_PATTERNS if lbl.lower() in types]
+        return _PII_PATTERNS
+    types = [t.strip().lower() for t in requested_types.split(",")]
+    return [(lbl, pat) for lbl, pat in _PII_PATTERNS if lbl.lower() in types]
 
-    found = [label for label, pat in patterns if pat.search(content)]
-    return f"PII detected: {', '.join(found)}" if found else None
 
+class _PiiScanner:
+    """All requested PII patterns folded into one alternation regex.
+
+    Each pattern becomes a named group (p0, p1, ...), so a single finditer
+    both detects every label and rebuilds the redacted string.
+    """
+
+    def __init__(self, patterns: list[tuple[str, re.Pattern]]):
+        self.patterns = [pat for _, pat in patterns]
+        self.labels = [label for label, _ in patterns]
+        self.placeholders = [f"[{label.upper().replace(' ', '_')}]" for label in self.labels]
+        alternatives = [
+            f"(?P<p{i}>{'(?i:' + pat.pattern + ')' if pat.flags & re.IGNORECASE else pat.pattern})"
+            for i, pat in enumerate(self.patterns)
+        ]
+        self.regex = re.compile("|".join(alternatives)) if alternatives else None
+
+    def _overlapped(self, content: str, spans: list[tuple[int, int]], found: set[int]) -> None:
+        """Add labels whose only matches start inside another label's match.
+
+        finditer never reports overlapping matches, but any match it skipped
+        must start inside a reported span, so only those offsets are probed.
+        """
+        for idx, pat in enumerate(self.patterns):
+            if idx in found:
+                continue
+            if any(pat.match(content, pos) for start, end in spans for pos in range(start, end)):
+                found.add(idx)
+
+    def _labels(self, found: set[int]) -> list[str]:
+        return [self.labels[i] for i in sorted(found)]
+
+    def detect(self, content: str) -> list[str]:
+        """Labels found in content, in _PII_PATTERNS order."""
+        if self.regex is None:
+            return []
+        found: set[int] = set()
+        spans: list[tuple[int, int]] = []
+        for m in self.regex.finditer(content):
+            found.add(int(m.lastgroup[1:]))
+            if len(found) == len(self.labels):
+                return self._labels(found)
+            spans.append(m.span())
+        if found:
+            self._overlapped(content, spans, found)
+        return self._labels(found)
+
+    def redact(self, content: str) -> tuple[list[str], str]:
+        """Labels found plus content with each match replaced by its placeholder."""
+        if self.regex is None:
+            return [], content
+        found: set[int] = set()
+        spans: list[tuple[int, int]] = []
+        parts: list[str] = []
+        last = 0
+        for m in self.regex.finditer(content):
+            idx = int(m.lastgroup[1:])
+            found.add(idx)
+            spans.append(m.span())
+            parts.append(content[last:m.start()])
+            parts.append(self.placeholders[idx])
+            last = m.end()
+        if not found:
+            return [], content
+        parts.append(content[last:])
+        if len(found) < len(self.labels):
+            self._overlapped(content, spans, found)
+        return self._labels(found), "".join(parts)
 
-def _redact_regex(content: str, requested_types: str) -> str:
-    """Best-effort regex redaction."""
-    modified = content
-    if requested_types.strip().upper() == "ALL":
-        patterns = _PII_PATTERNS
-    else:
-        types = [t.strip().lower() for t in requested_types.split(",")]
-        patterns = [(lbl, pat) for lbl, pat in _PII_PATTERNS if lbl.lower() in types]
 
-    for label, pat in patterns:
-        placeholder = f"[{label.upper().replace(' ', '_')}]"
-        modified = pat.sub(placeholder, modified)
-    return modified
+@functools.lru_cache(maxsize=256)
+def _pii_scanner(requested_types: str) -> _PiiScanner:
+    return _PiiScanner(_resolve_pii_patterns(requested_types))
 
 
-def _detect_pii_presidio(content: str, requested_types: str) -> tuple[Optional[str], Optional[str]]:
+def _detect_pii_regex(content: str, scanner: _PiiScanner) -> Optional[str]:
+    """Fast single-pass regex scan. Returns reason string or None."""
+    found = scanner.detect(content)
+    return f"PII detected: {', '.join(found)}" if found else None
+
+
+def _redact_regex(content: str, scanner: _PiiScanner) -> tuple[Optional[str], str]:
+    """Single-pass detection + best-effort redaction. Returns (reason, redacted)."""
+    found, redacted = scanner.redact(content)
+    return (f"PII detected: {', '.join(found)}" if found else None), redacted
+
+
+async def _detect_pii_presidio(content: str, requested_types: str) -> tuple[Optional[str], Optional[str]]:
     """NER pass via Presidio. Returns (reason, redacted_content) or (None, None)."""
     try:
-        from app.services.presidio_service import analyze_pii, redact_pii
-        hits = analyze_pii(content, requested_types)
-        if hits:
-            types_found = list({h["type"] for h in hits})
+        scan = await presidio_executor.analyze(content, requested_types)
+        if scan["hits"]:
+            types_found = list({h["type"] for h in scan["hits"]})
             reason = f"PII detected by NER: {', '.join(types_found)}"
-            redacted = redact_pii(content, requested_types) or content
-            return reason, redacted
+            return reason, scan["redacted"] or content
         return None, None
     except Exception:
         return None, None
 
 
+# ── Compiled rule sets ─────────────────────────────────────────────────────
+# Rules are loaded and compiled once per schema and reused until an admin
+# edits them (see FilteringService.invalidate).
+
+_VERSION_NAMESPACE = "filtering_rules"
+
+
+@dataclass
+class CompiledRule:
+    name: str
+    type: str
+    action: str
+    pattern: Optional[str]
+    keyword: Optional[str] = None                                  # lowercased, keyword rules
+    regex: Optional[re.Pattern] = None                             # regex rules
+    pii_types: str = "ALL"                                         # pii rules
+    pii_scanner: Optional[_PiiScanner] = None
+
+
+@dataclass
+class CompiledRuleSet:
+    version: str
+    rules: list[CompiledRule]          # non-semantic rules, priority DESC
+    semantic_rules: list[dict]         # raw rows handed to the LLM
+    keywords: KeywordMatcher           # all keyword rules, ranked by index in `rules`
+
+
+def compile_rules(rows: list[dict], version: str = "") -> CompiledRuleSet:
+    compiled: list[CompiledRule] = []
+    semantic: list[dict] = []
+    for row in rows:
+        rtype = row["type"]
+        rule = CompiledRule(name=row["name"], type=rtype, action=row["action"], pattern=row["pattern"])
+
+        if rtype == "keyword":
+            if not row["pattern"]:
+                continue
+            rule.keyword = row["pattern"].lower()
+        elif rtype == "regex":
+            if not row["pattern"]:
+                continue
+            try:
+                rule.regex = re.compile(row["pattern"], re.IGNORECASE)
+            except re.error:
+                continue
+        elif rtype == "pii":
+            rule.pii_types = row["pattern"] or "ALL"
+            rule.pii_scanner = _pii_scanner(rule.pii_types)
+        elif rtype == "semantic":
+            semantic.append(row)
+            continue
+        else:
+            continue
+        compiled.append(rule)
+
+    keywords = KeywordMatcher([(r.keyword, i) for i, r in enumerate(compiled) if r.type == "keyword"])
+    return CompiledRuleSet(version=version, rules=compiled, semantic_rules=semantic, keywords=keywords)
+
+
 class FilteringService:
+    def __init__(self):
+        self._rulesets: dict[str, CompiledRuleSet] = {}
+
     async def load_rules(self, session: AsyncSession, schema: str) -> list[dict]:
         result = await session.execute(
             text(f'SELECT * FROM "{schema}".filtering_rules WHERE is_active = TRUE ORDER BY priority DESC')
         )
         return [dict(row._mapping) for row in result]
 
-    async def evaluate(self, content: str, session: AsyncSession, schema: str) -> FilterResult:
-        rules = await self.load_rules(session, schema)
-        if not rules:
+    async def get_ruleset(self, session: AsyncSession, schema: str) -> CompiledRuleSet:
+        """Return the compiled rules for a schema, reloading only after invalidation."""
+        version = await get_version(_VERSION_NAMESPACE, schema)
+        cached = self._rulesets.get(schema)
+        if cached and cached.version == version:
+            return cached
+
+        ruleset = compile_rules(await self.load_rules(session, schema), version)
+        self._rulesets[schema] = ruleset
+        return ruleset
+
+    async def invalidate(self, schema: str) -> None:
+        """Drop cached rules for a schema in every API process."""
+        self._rulesets.pop(schema, None)
+        await bump_version(_VERSION_NAMESPACE, schema)
+
+    async def evaluate(
+        self, content: str, session: AsyncSession, schema: str, defer_semantic: bool = False,
+    ) -> FilterResult:
+        ruleset = await self.get_ruleset(session, schema)
+        if not ruleset.rules and not ruleset.semantic_rules:
             return FilterResult(action="allow")
 
-        for rule in rules:
-            rtype = rule["type"]
-            action = rule["action"]
+        # All keyword rules are resolved in a single scan; the rule at the
+        # returned index is the highest-priority keyword hit, so it fires when
+        # the loop below reaches it (keeps priority-ordered first-match).
+        keyword_hit = ruleset.keywords.first_match(content.lower()) if len(ruleset.keywords) else None
+
+        for index, rule in enumerate(ruleset.rules):
+            action = rule.action
 
             # ── keyword ───────────────────────────────────────────────────
-            if rtype == "keyword":
-                if rule["pattern"] and rule["pattern"].lower() in content.lower():
-                    return FilterResult(action=action, reason=f"Matched keyword: {rule['pattern']}")
+            if rule.type == "keyword":
+                if index == keyword_hit:
+                    return FilterResult(action=action, reason=f"Matched keyword: {rule.pattern}")
 
             # ── regex ─────────────────────────────────────────────────────
-            elif rtype == "regex":
-                try:
-                    if rule["pattern"] and re.search(rule["pattern"], content, re.IGNORECASE):
-                        return FilterResult(action=action, reason=f"Matched pattern: {rule['name']}")
-                except re.error:
-                    pass
+            elif rule.type == "regex":
+                if rule.regex.search(content):
+                    return FilterResult(action=action, reason=f"Matched pattern: {rule.name}")
 
             # ── pii ───────────────────────────────────────────────────────
-            elif rtype == "pii":
-                pii_types = rule["pattern"] or "ALL"
-
+            elif rule.type == "pii":
                 # Layer 1: fast regex (structured PII like SSN, email, credit card)
-                reason = _detect_pii_regex(content, pii_types)
-                if reason:
-                    if action == "modify":
-                        return FilterResult(action="modify", reason=reason, modified_content=_redact_regex(content, pii_types))
-                    return FilterResult(action=action, reason=reason)
+                if action == "modify":
+                    reason, redacted = _redact_regex(content, rule.pii_scanner)
+                    if reason:
+                        return FilterResult(action="modify", reason=reason, modified_content=redacted)
+                else:
+                    reason = _detect_pii_regex(content, rule.pii_scanner)
+                    if reason:
+                        return FilterResult(action=action, reason=reason)
 
                 # Layer 2: Presidio NER (catches names, locations, organisations, etc.)
-                ner_reason, redacted = _detect_pii_presidio(content, pii_types)
+                ner_reason, redacted = await _detect_pii_presidio(content, rule.pii_types)
                 if ner_reason:
                     if action == "modify":
                         return FilterResult(action="modify", reason=ner_reason, modified_content=redacted)
                     return FilterResult(action=action, reason=ner_reason)
 
         # ── semantic (Llama) — slow path, only if needed ──────────────────
-        semantic_rules = [r for r in rules if r["type"] == "semantic"]
-        if semantic_rules:
-            result = await llm_service.evaluate_filter(content, semantic_rules)
-            if result.get("action") in ("block", "modify"):
-                return FilterResult(
-                    action=result["action"],
-                    reason=result.get("reason"),
-                    modified_content=result.get("modified_content"),
-                )
+        if ruleset.semantic_rules:
+            if defer_semantic:
+                return FilterResult(action="allow", pending_semantic_rules=ruleset.semantic_rules)
+            return await self.evaluate_semantic(schema, content, ruleset.semantic_rules)
+
+        return FilterResult(action="allow")
 
+    async def evaluate_semantic(self, schema: str, content: str, semantic_rules: list[dict]) -> FilterResult:
+        """Semantic (Llama) pass — the part evaluate() skips with defer_semantic."""
+        result = await llm_service.evaluate_filter(schema, content, semantic_rules)
+        if result.get("action") in ("block", "modify"):
+            return FilterResult(
+                action=result["action"],
+                reason=result.get("reason"),
+                modified_content=result.get("modified_content"),
+            )
         return FilterResult(action="allow")
 
 
@@ -0,0 +1,82 @@
+"""Bounded conversation history for the chat route.
+
+Only the turns after the session's rolling summary are read, capped at
+CHAT_HISTORY_MAX_MESSAGES rows and CHAT_HISTORY_MAX_TOKENS estimated tokens.
+Older turns are represented by sessions.summary. Before the unsummarized turns
+outgrow the window, the summarize_history worker task folds all but the newest
+summary_keep_messages() of them into the summary, so no turn falls between
+the summary and the window.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+
+
+@dataclass
+class HistoryWindow:
+    messages: list[dict]
+    summary: Optional[str]
+    needs_summary: bool
+
+
+def estimate_tokens(content: str) -> int:
+    # ~4 characters per token for English text; only used for budgeting
+    return len(content) // 4 + 1
+
+
+def summary_keep_messages() -> int:
+    """Unsummarized messages the summarize task leaves out of the summary."""
+    return max(1, settings.CHAT_HISTORY_MAX_MESSAGES - settings.CHAT_SUMMARY_BATCH_MESSAGES)
+
+
+def _fit_budget(messages: list[dict], budget: int, max_messages: int) -> list[dict]:
+    """Keep the newest messages that fit the token budget and count (always the last one)."""
+    kept: list[dict] = []
+    used = 0
+    for message in reversed(messages):
+        cost = estimate_tokens(message["content"])
+        if kept and (used + cost > budget or len(kept) >= max_messages):
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    # Providers expect the conversation to open with a user turn
+    while len(kept) > 1 and kept[0]["role"] != "user":
+        kept.pop(0)
+    return kept
+
+
+async def load_history_window(session: AsyncSession, schema: str, session_id) -> HistoryWindow:
+    result = await session.execute(
+        text(f"""
+            SELECT s.summary, s.message_count - s.summary_message_count AS unsummarized,
+                   m.role, m.content
+            FROM "{schema}".sessions s
+            LEFT JOIN LATERAL (
+                SELECT role, content, created_at
+                FROM "{schema}".messages
+                WHERE session_id = s.id AND was_blocked = FALSE
+                  AND (s.summary_through IS NULL OR created_at > s.summary_through)
+                ORDER BY created_at DESC
+                LIMIT :limit
+            ) m ON TRUE
+            WHERE s.id = :sid
+            ORDER BY m.created_at
+        """),
+        {"sid": str(session_id), "limit": settings.CHAT_HISTORY_MAX_MESSAGES},
+    )
+    rows = result.fetchall()
+    messages = [{"role": r.role, "content": r.content} for r in rows if r.role is not None]
+    summary = rows[0].summary if rows else None
+    unsummarized = rows[0].unsummarized if rows else 0
+    return HistoryWindow(
+        messages=_fit_budget(messages, settings.CHAT_HISTORY_MAX_TOKENS, settings.CHAT_HISTORY_MAX_MESSAGES),
+        summary=summary,
+        # This turn's reply plus the next message must still fit in the window;
+        # otherwise the oldest unsummarized turn would drop out of both
+        needs_summary=unsummarized + 2 > settings.CHAT_HISTORY_MAX_MESSAGES,
+    )
@@ -0,0 +1,97 @@
+"""Multi-keyword matching for keyword filtering rules.
+
+A tenant's keyword rules are built into one matcher that scans a message once
+and reports the highest-priority rule whose keyword occurs in it.
+"""
+from typing import Optional
+
+# Below this many keywords, C-level `in` checks beat a pure-Python automaton
+# scan; see bench_keywords.py for the crossover.
+AUTOMATON_MIN_KEYWORDS = 128
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over lowercased keywords.
+
+    `keywords` is a list of (keyword, rank) pairs where a lower rank means a
+    higher-priority rule. `first_match` returns the lowest rank whose keyword
+    occurs in the (already lowercased) text, or None.
+    """
+
+    def __init__(self, keywords: list[tuple[str, int]]):
+        best: dict[str, int] = {}
+        for keyword, rank in keywords:
+            if keyword and (keyword not in best or rank < best[keyword]):
+                best[keyword] = rank
+
+        # Sorted by rank so the linear fallback can stop at the first hit
+        self._ordered = sorted(best.items(), key=lambda kv: kv[1])
+        self._min_rank = self._ordered[0][1] if self._ordered else None
+        self._use_automaton = len(self._ordered) >= AUTOMATON_MIN_KEYWORDS
+
+        if self._use_automaton:
+            self._build(best)
+
+    def __len__(self) -> int:
+        return len(self._ordered)
+
+    def _build(self, best: dict[str, int]) -> None:
+        goto: list[dict[str, int]] = [{}]
+        out: list[Optional[int]] = [None]
+
+        for keyword, rank in best.items():
+            node = 0
+            for ch in keyword:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    out.append(None)
+                node = nxt
+            out[node] = rank
+
+        # BFS to set failure links; each node's output becomes the best rank
+        # among itself and every suffix reachable through its failure chain.
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for node in queue:
+            for ch, child in goto[node].items():
+                queue.append(child)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[child] = target if target != child else 0
+                inherited = out[fail[child]]
+                if inherited is not None and (out[child] is None or inherited < out[child]):
+                    out[child] = inherited
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def first_match(self, lowered: str) -> Optional[int]:
+        if not self._ordered:
+            return None
+
+        if not self._use_automaton:
+            for keyword, rank in self._ordered:
+                if keyword in lowered:
+                    return rank
+            return None
+
+        goto, fail, out = self._goto, self._fail, self._out
+        min_rank = self._min_rank
+        best: Optional[int] = None
+        node = 0
+        for ch in lowered:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            rank = out[node]
+            if rank is not None and (best is None or rank < best):
+                best = rank
+                if best == min_rank:
+                    break
+        return best
@@ -1,17 +1,75 @@
+import asyncio
+import hashlib
 import json
+import re
 import ollama
+from redis.exceptions import RedisError
+from app.core import metrics
+from app.core.cache import get_redis
 from app.core.config import settings
 
+_ALLOW = {"action": "allow", "reason": None, "modified_content": None}
+
 
 class LLMService:
     def __init__(self):
         self.client = ollama.AsyncClient(host=settings.OLLAMA_URL)
         self.model = settings.OLLAMA_MODEL
+        # verdict key -> task evaluating it, so concurrent identical checks share one call
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    def _verdict_key(self, schema: str, content: str, rules: list[dict]) -> str:
+        # Whitespace-only normalization: a cached "modify" verdict carries a
+        # rewritten message, so anything that changes the text must miss.
+        normalized = re.sub(r"\s+", " ", content).strip()
+        rules_fp = json.dumps(
+            [self.model] + [[r["name"], r.get("pattern"), r.get("action")] for r in rules],
+            sort_keys=True,
+        )
+        digest = hashlib.sha256(f"{rules_fp}\0{normalized}".encode()).hexdigest()
+        # Per tenant: a shared verdict (and its speed) would reveal that
+        # another org sent the same message under the same rules
+        return f"semantic_verdict:{schema}:{digest}"
 
-    async def evaluate_filter(self, content: str, rules: list[dict]) -> dict:
+    async def evaluate_filter(self, schema: str, content: str, rules: list[dict]) -> dict:
         """Ask Llama to semantically evaluate content against rules.
+        Verdicts are cached in Redis per (tenant, normalized message, rule set) for
+        SEMANTIC_VERDICT_TTL_SECONDS, and concurrent identical evaluations
+        share a single Ollama request.
         Returns: {"action": "allow"|"block"|"modify", "reason": str, "modified_content": str|None}
         """
+        key = self._verdict_key(schema, content, rules)
+        try:
+            cached = await get_redis().get(key)
+        except RedisError:
+            cached = None
+        if cached:
+            metrics.incr("semantic_verdict_cache.hits")
+            return json.loads(cached)
+        metrics.incr("semantic_verdict_cache.misses")
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._evaluate_and_cache(key, content, rules))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            metrics.incr("semantic_verdict_cache.coalesced")
+        # shield: one cancelled caller must not cancel the shared request
+        return await asyncio.shield(task)
+
+    async def _evaluate_and_cache(self, key: str, content: str, rules: list[dict]) -> dict:
+        verdict = await self._ask_filter(content, rules)
+        if verdict is None:
+            # If Llama doesn't return clean JSON, default to allow (not cached)
+            return dict(_ALLOW)
+        try:
+            await get_redis().set(key, json.dumps(verdict), ex=settings.SEMANTIC_VERDICT_TTL_SECONDS)
+        except RedisError:
+            pass
+        return verdict
+
+    async def _ask_filter(self, content: str, rules: list[dict]) -> dict | None:
         rules_text = "\n".join(
             [f"- [{r['name']}]: {r['pattern']}" for r in rules if r.get("pattern")]
         )
@@ -41,10 +99,10 @@ Respond ONLY with valid JSON, no extra text:
         )
         raw = response["message"]["content"].strip()
         try:
-            return json.loads(raw)
+            verdict = json.loads(raw)
         except json.JSONDecodeError:
-            # If Llama doesn't return clean JSON, default to allow
-            return {"action": "allow", "reason": None, "modified_content": None}
+            return None
+        return verdict if isinstance(verdict, dict) else None
 
     async def generate_suggestions(self, conversation: list[dict], org_context: str = "") -> list[str]:
         """Generate follow-up prompt suggestions based on the conversation."""
@@ -89,5 +147,31 @@ Respond with only the title, no punctuation."""
         )
         return response["message"]["content"].strip()
 
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        """Embed texts with the local embedding model (see rag.py)."""
+        response = await self.client.embed(model=settings.OLLAMA_EMBED_MODEL, input=texts)
+        return response["embeddings"]
+
+    async def summarize_history(self, previous_summary: str | None, messages: list[dict]) -> str:
+        """Fold older conversation turns into a rolling summary."""
+        transcript = "\n".join(f"{m['role']}: {m['content'][:2000]}" for m in messages)
+        prompt = f"""Update the running summary of a conversation between a user and an AI assistant.
+
+Current summary:
+{previous_summary or "(none yet)"}
+
+New messages:
+{transcript}
+
+Write the updated summary in at most 200 words. Keep facts, decisions, names and open questions the assistant will need later.
+Respond with only the summary."""
+
+        response = await self.client.chat(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            options={"temperature": 0},
+        )
+        return response["message"]["content"].strip()
+
 
 llm_service = LLMService()
@@ -0,0 +1,135 @@
+"""Presidio NER off the event loop.
+
+spaCy's en_core_web_lg pipeline is CPU-bound and can take hundreds of
+milliseconds on a long paste. Requests are queued here, micro-batched for a few
+milliseconds (long texts are sent on their own), and analysed in a process pool
+whose workers load the engines once at start-up, so the uvicorn loop keeps
+serving other tenants meanwhile.
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.core.config import settings
+from app.services.presidio_service import ScanCache, scan_cache
+
+
+def _init_worker():
+    from app.services.presidio_service import _get_engines
+    _get_engines()
+
+
+def _run_batch(items: list[tuple[str, str]]) -> list[dict]:
+    from app.services.presidio_service import analyze_batch
+    return analyze_batch(items)
+
+
+class PresidioExecutor:
+    def __init__(self):
+        self._pool: ProcessPoolExecutor | None = None
+        self._pending: list[tuple[str, str, asyncio.Future]] = []
+        self._pending_chars = 0
+        self._flush_handle: asyncio.TimerHandle | None = None
+
+    def start(self) -> None:
+        if self._pool is not None:
+            return
+        # spawn, not fork: the parent runs an event loop and threads
+        self._pool = ProcessPoolExecutor(
+            max_workers=settings.PRESIDIO_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        # Start a worker now so the model is loaded before the first message
+        self._pool.submit(int)
+
+    def shutdown(self) -> None:
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def analyze(self, text: str, requested_types: str) -> dict:
+        """Scan text for PII; same result shape as presidio_service.scan_pii."""
+        key = ScanCache.key(text, requested_types)
+        cached = scan_cache.get(key)
+        if cached is not None:
+            return cached
+
+        self.start()
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        if len(text) >= settings.PRESIDIO_SOLO_CHARS:
+            # Long pastes get their own nlp.pipe call so short messages
+            # batched alongside them don't wait on their parse
+            self._submit([(text, requested_types, fut)])
+        else:
+            self._pending.append((text, requested_types, fut))
+            self._pending_chars += len(text)
+            if (
+                len(self._pending) >= settings.PRESIDIO_BATCH_SIZE
+                or self._pending_chars >= settings.PRESIDIO_BATCH_MAX_CHARS
+            ):
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(settings.PRESIDIO_BATCH_WINDOW_MS / 1000, self._flush)
+        scan = await asyncio.wait_for(fut, settings.PRESIDIO_TIMEOUT_SECONDS)
+        scan_cache.put(key, scan, len(text))
+        return scan
+
+    def _flush(self) -> None:
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        self._pending_chars = 0
+        self._submit(batch)
+
+    def _submit(self, batch: list[tuple[str, str, asyncio.Future]]) -> None:
+        batch = [item for item in batch if not item[2].done()]
+        if not batch:
+            return
+
+        self.start()
+        pool = self._pool
+        loop = asyncio.get_running_loop()
+        try:
+            work = loop.run_in_executor(pool, _run_batch, [(text, types) for text, types, _ in batch])
+        except (BrokenProcessPool, RuntimeError) as e:
+            # Broken before _resolve noticed, or shut down: fail the batch now
+            # rather than leave its callers waiting
+            self._reset_pool(pool)
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        work.add_done_callback(lambda f: self._resolve(batch, f, pool))
+
+    def _reset_pool(self, pool: ProcessPoolExecutor | None) -> None:
+        """Drop a broken pool; a fresh one starts on the next request."""
+        # Only the pool that failed: a newer, healthy pool may already be current
+        if pool is not None and self._pool is pool:
+            pool.shutdown(wait=False)
+            self._pool = None
+
+    def _resolve(
+        self, batch: list[tuple[str, str, asyncio.Future]], work: asyncio.Future, pool: ProcessPoolExecutor,
+    ) -> None:
+        exc = None if work.cancelled() else work.exception()
+        if isinstance(exc, BrokenProcessPool):
+            # A worker died (e.g. OOM)
+            self._reset_pool(pool)
+        for i, (_, _, fut) in enumerate(batch):
+            if fut.done():
+                continue
+            if work.cancelled():
+                fut.cancel()
+            elif exc is not None:
+                fut.set_exception(exc)
+            else:
+                fut.set_result(work.result()[i])
+
+
+presidio_executor = PresidioExecutor()
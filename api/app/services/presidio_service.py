@@ -1,12 +1,19 @@
 import functools
+import hashlib
+from collections import OrderedDict
 from typing import Optional
 
-from presidio_analyzer import AnalyzerEngine
-from presidio_anonymizer import AnonymizerEngine
+from app.core import metrics
+from app.core.config import settings
 
 
 @functools.lru_cache(maxsize=1)
 def _get_engines():
+    # Imported lazily: the API process only needs ENTITY_MAP; the spaCy model
+    # is loaded inside the Presidio worker processes (see presidio_executor).
+    from presidio_analyzer import AnalyzerEngine
+    from presidio_anonymizer import AnonymizerEngine
+
     analyzer = AnalyzerEngine()
     anonymizer = AnonymizerEngine()
     return analyzer, anonymizer
@@ -45,51 +52,127 @@ _SAFE_ENTITIES = {
 ALL_ENTITIES = list(set(ENTITY_MAP.values()))
 
 
-def analyze_pii(text: str, requested_types: str) -> list[dict]:
+HIT_THRESHOLD = 0.85  # raised threshold to reduce false positives
+
+
+def _resolve_entities(requested_types: str) -> list[str]:
+    if requested_types.strip().upper() == "ALL":
+        return sorted(_SAFE_ENTITIES)  # conservative default, no PERSON/LOCATION
+    types = [t.strip().lower() for t in requested_types.split(",")]
+    entities = sorted({ENTITY_MAP[t] for t in types if t in ENTITY_MAP})
+    return entities or sorted(_SAFE_ENTITIES)
+
+
+def _to_scan(text: str, results, anonymizer) -> dict:
+    """Build hits, redaction and spans from one set of analyzer results."""
+    return {
+        "hits": [
+            {
+                "type": r.entity_type,
+                "score": round(r.score, 2),
+                "start": r.start,
+                "end": r.end,
+                "text": text[r.start : r.end],
+            }
+            for r in results
+            if r.score >= HIT_THRESHOLD
+        ],
+        "redacted": anonymizer.anonymize(text=text, analyzer_results=results).text if results else None,
+        "spans": [(r.start, r.end, r.entity_type) for r in results],
+    }
+
+
+# ── Scan cache ─────────────────────────────────────────────────────────────
+# Keyed by a hash of the text plus the entity set, so repeated pastes of the
+# same boilerplate skip NER entirely. Bounded by total cached characters.
+
+class ScanCache:
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self._entries: OrderedDict[tuple[bytes, tuple[str, ...]], tuple[dict, int]] = OrderedDict()
+        self._chars = 0
+
+    @staticmethod
+    def key(text: str, requested_types: str) -> tuple[bytes, tuple[str, ...]]:
+        return hashlib.sha256(text.encode()).digest(), tuple(_resolve_entities(requested_types))
+
+    def get(self, key) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            metrics.incr("presidio_cache.misses")
+            return None
+        self._entries.move_to_end(key)
+        metrics.incr("presidio_cache.hits")
+        return entry[0]
+
+    def put(self, key, scan: dict, text_len: int) -> None:
+        size = text_len + len(scan["redacted"] or "")
+        if size > self.max_chars:
+            return
+        old = self._entries.pop(key, None)
+        if old:
+            self._chars -= old[1]
+        self._entries[key] = (scan, size)
+        self._chars += size
+        while self._chars > self.max_chars:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._chars -= evicted
+
+
+scan_cache = ScanCache(settings.PRESIDIO_CACHE_MAX_CHARS)
+
+
+def scan_pii(text: str, requested_types: str) -> dict:
     """
-    Run Presidio NER analysis on text.
+    Analyze text once and return everything callers need from that analysis:
+      hits:     entities scoring >= HIT_THRESHOLD (type, score, start, end, text)
+      redacted: text with every detected entity replaced by <TYPE>, or None
+      spans:    (start, end, type) of every analyzer result
     requested_types: "ALL" or comma-separated friendly names like "person,email address"
-    Returns list of found entities with type, score, start, end, and matched text snippet.
     """
-    analyzer, _ = _get_engines()
+    key = ScanCache.key(text, requested_types)
+    cached = scan_cache.get(key)
+    if cached is not None:
+        return cached
 
-    if requested_types.strip().upper() == "ALL":
-        entities = list(_SAFE_ENTITIES)  # conservative default, no PERSON/LOCATION
-    else:
-        types = [t.strip().lower() for t in requested_types.split(",")]
-        entities = [ENTITY_MAP[t] for t in types if t in ENTITY_MAP]
-        if not entities:
-            entities = list(_SAFE_ENTITIES)
-
-    results = analyzer.analyze(text=text, entities=entities, language="en")
-    return [
-        {
-            "type": r.entity_type,
-            "score": round(r.score, 2),
-            "start": r.start,
-            "end": r.end,
-            "text": text[r.start : r.end],
-        }
-        for r in results
-        if r.score >= 0.85  # raised threshold to reduce false positives
-    ]
+    analyzer, anonymizer = _get_engines()
+    results = analyzer.analyze(text=text, entities=list(key[1]), language="en")
+    scan = _to_scan(text, results, anonymizer)
+    scan_cache.put(key, scan, len(text))
+    return scan
+
+
+def analyze_pii(text: str, requested_types: str) -> list[dict]:
+    """Found entities with type, score, start, end, and matched text snippet."""
+    return scan_pii(text, requested_types)["hits"]
 
 
 def redact_pii(text: str, requested_types: str) -> Optional[str]:
     """Replace detected PII with <TYPE> placeholders. Returns None if nothing was found."""
+    return scan_pii(text, requested_types)["redacted"]
+
+
+def analyze_batch(items: list[tuple[str, str]]) -> list[dict]:
+    """
+    Scan many (text, requested_types) pairs at once.
+    Texts sharing an entity set go through spaCy together (nlp.pipe).
+    Returns one scan_pii-shaped dict per input, in input order.
+    """
+    from presidio_analyzer import BatchAnalyzerEngine
+
     analyzer, anonymizer = _get_engines()
+    batch_analyzer = BatchAnalyzerEngine(analyzer_engine=analyzer)
 
-    if requested_types.strip().upper() == "ALL":
-        entities = list(_SAFE_ENTITIES)
-    else:
-        types = [t.strip().lower() for t in requested_types.split(",")]
-        entities = [ENTITY_MAP[t] for t in types if t in ENTITY_MAP]
-        if not entities:
-            entities = list(_SAFE_ENTITIES)
-
-    results = analyzer.analyze(text=text, entities=entities, language="en")
-    if not results:
-        return None
-
-    anonymized = anonymizer.anonymize(text=text, analyzer_results=results)
-    return anonymized.text
+    groups: dict[tuple[str, ...], list[int]] = {}
+    for i, (_, requested_types) in enumerate(items):
+        groups.setdefault(tuple(_resolve_entities(requested_types)), []).append(i)
+
+    out: list[dict] = [{}] * len(items)
+    for entities, indices in groups.items():
+        texts = [items[i][0] for i in indices]
+        all_results = batch_analyzer.analyze_iterator(
+            texts, language="en", entities=list(entities), batch_size=len(texts),
+        )
+        for i, text, results in zip(indices, texts, all_results):
+            out[i] = _to_scan(text, results, anonymizer)
+    return out
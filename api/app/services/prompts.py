@@ -0,0 +1,86 @@
+"""Prebuilt system prompt prefixes for the chat route.
+
+The stable part of a system prompt (assigned agent prompt + vertical prompt)
+is built once per (schema, vertical, agent) and reused across turns and users.
+Which vertical and agent apply to a user is cached per (schema, user).
+Both caches are tied to the schema's "system_prompts" version stamp, which
+invalidate_prompts() bumps when settings, agents or assignments change.
+Per-turn parts (retrieved document chunks, conversation summary) are appended
+after the prefix by the caller.
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import metrics
+from app.core.cache import bump_version, get_version
+from app.core.config import settings
+from app.schemas.schemas import OrgContext
+from app.services.verticals import build_system_prompt
+
+_PROMPTS_NAMESPACE = "system_prompts"
+
+
+@dataclass(frozen=True)
+class PromptContext:
+    vertical: str
+    agent_id: Optional[str]
+    prefix: str
+
+
+# (schema, user_id) -> (version, expires_at, vertical, agent_id)
+_user_contexts: OrderedDict[tuple[str, str], tuple[str, float, str, Optional[str]]] = OrderedDict()
+# (schema, vertical, agent_id) -> (version, PromptContext)
+_prefixes: dict[tuple[str, str, Optional[str]], tuple[str, PromptContext]] = {}
+
+
+async def get_prompt_context(ctx: OrgContext, tenant: AsyncSession) -> PromptContext:
+    schema = ctx.schema_name
+    version = await get_version(_PROMPTS_NAMESPACE, schema)
+    user_key = (schema, str(ctx.user_id))
+
+    cached = _user_contexts.get(user_key)
+    if cached and cached[0] == version and cached[1] > time.monotonic():
+        _user_contexts.move_to_end(user_key)
+        prefix = _prefixes.get((schema, cached[2], cached[3]))
+        if prefix and prefix[0] == version:
+            metrics.incr("prompt_cache.hits")
+            return prefix[1]
+
+    metrics.incr("prompt_cache.misses")
+    result = await tenant.execute(
+        text(f"""
+            SELECT o.vertical, a.id AS agent_id, a.system_prompt AS agent_prompt
+            FROM public.organizations o
+            LEFT JOIN "{schema}".user_agent_assignments uaa ON uaa.user_id = CAST(:uid AS uuid)
+            LEFT JOIN "{schema}".agents a ON a.id = uaa.agent_id AND a.is_active = TRUE
+            WHERE o.clerk_org_id = :org_id
+        """),
+        {"uid": str(ctx.user_id), "org_id": ctx.clerk_org_id},
+    )
+    row = result.fetchone()
+    vertical = (row.vertical if row else None) or "general"
+    agent_id = str(row.agent_id) if row and row.agent_id else None
+
+    prefix = build_system_prompt(vertical, [])
+    if agent_id:
+        prefix = row.agent_prompt + "\n\n" + prefix
+    prompt = PromptContext(vertical=vertical, agent_id=agent_id, prefix=prefix)
+
+    _prefixes[(schema, vertical, agent_id)] = (version, prompt)
+    _user_contexts[user_key] = (version, time.monotonic() + settings.PROMPT_CACHE_TTL_SECONDS, vertical, agent_id)
+    _user_contexts.move_to_end(user_key)
+    while len(_user_contexts) > settings.PROMPT_CACHE_MAX_USERS:
+        _user_contexts.popitem(last=False)
+    return prompt
+
+
+async def invalidate_prompts(schema: str) -> None:
+    """Drop cached prompts for a schema in every API process."""
+    for key in [k for k in _prefixes if k[0] == schema]:
+        _prefixes.pop(key, None)
+    await bump_version(_PROMPTS_NAMESPACE, schema)
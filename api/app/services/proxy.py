@@ -1,8 +1,13 @@
 import json
+import time
 import httpx
-from typing import AsyncGenerator
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, AsyncIterator
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
+from app.core import metrics
+from app.core.cache import get_version, bump_version
+from app.core.config import settings
 from app.core.security import decrypt_api_key
 
 PROVIDER_DEFAULTS = {
@@ -11,8 +16,93 @@ PROVIDER_DEFAULTS = {
     "gemini": "gemini-1.5-pro",
 }
 
+PROVIDER_BASE_URLS = {
+    "openai": "https://api.openai.com",
+    "anthropic": "https://api.anthropic.com",
+    "gemini": "https://generativelanguage.googleapis.com",
+}
+
+
+# ── Shared HTTP clients ────────────────────────────────────────────────────
+# One long-lived pool per provider so turns reuse warm TCP/TLS (and HTTP/2)
+# connections. Opened and closed in the FastAPI lifespan (main.py).
+
+_clients: dict[str, httpx.AsyncClient] = {}
+
+
+def _build_client(provider: str) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=PROVIDER_BASE_URLS[provider],
+        http2=settings.PROVIDER_HTTP2,
+        limits=httpx.Limits(
+            max_connections=settings.PROVIDER_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.PROVIDER_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.PROVIDER_KEEPALIVE_SECONDS,
+        ),
+        timeout=httpx.Timeout(
+            connect=settings.PROVIDER_CONNECT_TIMEOUT,
+            read=settings.PROVIDER_READ_TIMEOUT,
+            write=settings.PROVIDER_WRITE_TIMEOUT,
+            pool=settings.PROVIDER_POOL_TIMEOUT,
+        ),
+    )
+
+
+def open_provider_clients() -> None:
+    for provider in PROVIDER_BASE_URLS:
+        if provider not in _clients:
+            _clients[provider] = _build_client(provider)
+
+
+async def close_provider_clients() -> None:
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def get_client(provider: str) -> httpx.AsyncClient:
+    # Created lazily too, for scripts that run without the app lifespan
+    if provider not in _clients:
+        _clients[provider] = _build_client(provider)
+    return _clients[provider]
+
+
+@asynccontextmanager
+async def _provider_stream(provider: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+    """POST a streaming request on the provider's shared client.
+
+    Records time to first byte (response headers) and whether the request
+    reused a pooled connection or had to open a new one.
+    """
+    opened = False
+
+    async def trace(event_name: str, info: dict):
+        nonlocal opened
+        if event_name.endswith("connect_tcp.started"):
+            opened = True
+
+    start = time.perf_counter()
+    async with get_client(provider).stream("POST", url, extensions={"trace": trace}, **kwargs) as response:
+        metrics.observe(f"provider.{provider}.ttfb", time.perf_counter() - start)
+        metrics.incr(f"provider_connection_reuse.{provider}.{'misses' if opened else 'hits'}")
+        yield response
+
+
+# ── Connection cache ───────────────────────────────────────────────────────
+# Decrypted connection rows per (schema, provider), dropped after
+# CONNECTION_CACHE_TTL_SECONDS or when /admin/gpt-connections changes them.
+
+_CONNECTIONS_NAMESPACE = "gpt_connections"
+_connection_cache: dict[tuple[str, str], tuple[str, float, dict]] = {}  # -> (version, expires_at, conn)
+
 
 async def get_connection(provider: str, session: AsyncSession, schema: str) -> dict:
+    version = await get_version(_CONNECTIONS_NAMESPACE, schema)
+    cached = _connection_cache.get((schema, provider))
+    if cached and cached[0] == version and cached[1] > time.monotonic():
+        return cached[2]
+
     result = await session.execute(
         text(f'SELECT * FROM "{schema}".gpt_connections WHERE provider = :provider AND is_active = TRUE'),
         {"provider": provider},
@@ -22,78 +112,189 @@ async def get_connection(provider: str, session: AsyncSession, schema: str) -> d
         raise ValueError(f"No active API key configured for provider: {provider}")
     conn = dict(row._mapping)
     conn["api_key"] = decrypt_api_key(conn["encrypted_api_key"])
+    _connection_cache[(schema, provider)] = (version, time.monotonic() + settings.CONNECTION_CACHE_TTL_SECONDS, conn)
     return conn
 
 
-async def stream_openai(messages: list[dict], api_key: str, model: str) -> AsyncGenerator[str, None]:
-    async with httpx.AsyncClient(timeout=60) as client:
-        async with client.stream(
-            "POST",
-            "https://api.openai.com/v1/chat/completions",
-            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
-            json={"model": model, "messages": messages, "stream": True},
-        ) as response:
-            response.raise_for_status()
-            async for line in response.aiter_lines():
-                if line.startswith("data: "):
-                    data = line[6:]
-                    if data == "[DONE]":
-                        break
-                    try:
-                        chunk = json.loads(data)
-                        content = chunk["choices"][0]["delta"].get("content", "")
-                        if content:
-                            yield content
-                    except (json.JSONDecodeError, KeyError):
-                        continue
+async def invalidate_connections(schema: str) -> None:
+    """Drop cached connections for a schema in every API process."""
+    for key in [k for k in _connection_cache if k[0] == schema]:
+        _connection_cache.pop(key, None)
+    await bump_version(_CONNECTIONS_NAMESPACE, schema)
+
 
+# ── Provider adapters ──────────────────────────────────────────────────────
+# Map a provider-neutral turn (stable system prompt, per-turn context, history
+# of {"role", "content"} dicts) onto each API's request body: OpenAI takes
+# system messages inline, Anthropic a top-level `system` field and Gemini a
+# `systemInstruction`.
 
-async def stream_anthropic(messages: list[dict], api_key: str, model: str) -> AsyncGenerator[str, None]:
-    async with httpx.AsyncClient(timeout=60) as client:
-        async with client.stream(
-            "POST",
-            "https://api.anthropic.com/v1/messages",
-            headers={
-                "x-api-key": api_key,
-                "anthropic-version": "2023-06-01",
-                "Content-Type": "application/json",
-            },
-            json={"model": model, "messages": messages, "stream": True, "max_tokens": 4096},
-        ) as response:
-            response.raise_for_status()
-            async for line in response.aiter_lines():
-                if line.startswith("data: "):
-                    try:
-                        event = json.loads(line[6:])
-                        if event.get("type") == "content_block_delta":
-                            yield event["delta"].get("text", "")
-                    except (json.JSONDecodeError, KeyError):
+_EPHEMERAL = {"type": "ephemeral"}
+
+
+def _anthropic_message(role: str, content: str) -> dict:
+    return {"role": role, "content": [{"type": "text", "text": content}]}
+
+
+def _gemini_content(role: str, content: str) -> dict:
+    return {"role": "model" if role == "assistant" else "user", "parts": [{"text": content}]}
+
+
+def openai_request(messages: list[dict], model: str, system: str | None, context: str | None) -> dict:
+    # OpenAI caches the longest previously-seen prompt prefix automatically, so
+    # keep the stable system prompt and history first and put the per-turn
+    # context right before the newest message.
+    final_messages = [{"role": "system", "content": system}] if system else []
+    final_messages += messages[:-1]
+    if context:
+        final_messages.append({"role": "system", "content": context})
+    final_messages += messages[-1:]
+    return {
+        "model": model, "messages": final_messages, "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+
+
+def anthropic_request(messages: list[dict], model: str, system: str | None, context: str | None) -> dict:
+    final_messages = [_anthropic_message(m["role"], m["content"]) for m in messages]
+    # Cache breakpoint at the end of the previous turns, so the history prefix
+    # written this turn is read back on the next one
+    if len(final_messages) > 1:
+        final_messages[-2]["content"][-1]["cache_control"] = _EPHEMERAL
+    if context and final_messages:
+        # Per-turn context rides with the new message so it can't break the cached prefix
+        final_messages[-1]["content"].insert(0, {"type": "text", "text": context})
+
+    body = {"model": model, "messages": final_messages, "stream": True, "max_tokens": 4096}
+    if system:
+        body["system"] = [{"type": "text", "text": system, "cache_control": _EPHEMERAL}]
+    return body
+
+
+def gemini_request(messages: list[dict], system: str | None, context: str | None) -> dict:
+    contents = [_gemini_content(m["role"], m["content"]) for m in messages]
+    if context and contents:
+        # Same placement as Anthropic: the instruction and history stay a stable prefix
+        contents[-1]["parts"].insert(0, {"text": context})
+
+    body = {"contents": contents}
+    if system:
+        body["systemInstruction"] = {"parts": [{"text": system}]}
+    return body
+
+
+async def stream_openai(
+    messages: list[dict], api_key: str, model: str,
+    system: str | None = None, context: str | None = None, usage: dict | None = None,
+) -> AsyncGenerator[str, None]:
+    async with _provider_stream(
+        "openai",
+        "/v1/chat/completions",
+        headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+        json=openai_request(messages, model, system, context),
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
+                data = line[6:]
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                    if chunk.get("usage") and usage is not None:
+                        # Final chunk (no choices) when include_usage is set
+                        usage["input_tokens"] = chunk["usage"].get("prompt_tokens", 0)
+                        usage["output_tokens"] = chunk["usage"].get("completion_tokens", 0)
+                        usage["cached_tokens"] = (chunk["usage"].get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+                    if not chunk.get("choices"):
                         continue
+                    content = chunk["choices"][0]["delta"].get("content", "")
+                    if content:
+                        yield content
+                except (json.JSONDecodeError, KeyError):
+                    continue
 
 
-async def stream_gemini(messages: list[dict], api_key: str, model: str) -> AsyncGenerator[str, None]:
-    # Convert to Gemini format
-    contents = [{"role": m["role"] if m["role"] != "assistant" else "model", "parts": [{"text": m["content"]}]} for m in messages]
-    async with httpx.AsyncClient(timeout=60) as client:
-        async with client.stream(
-            "POST",
-            f"https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent?key={api_key}",
-            json={"contents": contents},
-        ) as response:
-            response.raise_for_status()
-            buffer = ""
-            async for chunk in response.aiter_text():
-                buffer += chunk
+async def stream_anthropic(
+    messages: list[dict], api_key: str, model: str,
+    system: str | None = None, context: str | None = None, usage: dict | None = None,
+) -> AsyncGenerator[str, None]:
+    async with _provider_stream(
+        "anthropic",
+        "/v1/messages",
+        headers={
+            "x-api-key": api_key,
+            "anthropic-version": "2023-06-01",
+            "Content-Type": "application/json",
+        },
+        json=anthropic_request(messages, model, system, context),
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
                 try:
-                    data = json.loads(buffer)
-                    for candidate in data.get("candidates", []):
-                        for part in candidate.get("content", {}).get("parts", []):
-                            yield part.get("text", "")
-                    buffer = ""
-                except json.JSONDecodeError:
+                    event = json.loads(line[6:])
+                    if event.get("type") == "content_block_delta":
+                        yield event["delta"].get("text", "")
+                    elif usage is not None and event.get("type") == "message_start":
+                        start_usage = event["message"].get("usage", {})
+                        usage["input_tokens"] = (
+                            start_usage.get("input_tokens", 0)
+                            + start_usage.get("cache_creation_input_tokens", 0)
+                            + start_usage.get("cache_read_input_tokens", 0)
+                        )
+                        usage["cached_tokens"] = start_usage.get("cache_read_input_tokens", 0)
+                    elif usage is not None and event.get("type") == "message_delta":
+                        usage["output_tokens"] = event.get("usage", {}).get("output_tokens", 0)
+                except (json.JSONDecodeError, KeyError):
                     continue
 
 
+def _gemini_event_texts(payload: str, usage: dict | None = None) -> list[str]:
+    """Text parts of one streamGenerateContent SSE event (a GenerateContentResponse)."""
+    try:
+        data = json.loads(payload)
+    except json.JSONDecodeError:
+        return []
+    metadata = data.get("usageMetadata")
+    if metadata and usage is not None:
+        # Cumulative; the last event carries the totals
+        usage["input_tokens"] = metadata.get("promptTokenCount", 0)
+        usage["output_tokens"] = metadata.get("candidatesTokenCount", 0)
+        usage["cached_tokens"] = metadata.get("cachedContentTokenCount", 0)
+    return [
+        part["text"]
+        for candidate in data.get("candidates", [])
+        for part in candidate.get("content", {}).get("parts", [])
+        if part.get("text")
+    ]
+
+
+async def stream_gemini(
+    messages: list[dict], api_key: str, model: str,
+    system: str | None = None, context: str | None = None, usage: dict | None = None,
+) -> AsyncGenerator[str, None]:
+    # alt=sse: one JSON response per SSE event, so each event is parsed once as
+    # it arrives instead of re-parsing a growing JSON array.
+    async with _provider_stream(
+        "gemini",
+        f"/v1beta/models/{model}:streamGenerateContent?alt=sse&key={api_key}",
+        json=gemini_request(messages, system, context),
+    ) as response:
+        response.raise_for_status()
+        data_lines: list[str] = []
+        async for line in response.aiter_lines():
+            if line.startswith("data:"):
+                data_lines.append(line[5:].lstrip())
+            elif not line and data_lines:
+                for text in _gemini_event_texts("\n".join(data_lines), usage):
+                    yield text
+                data_lines = []
+        if data_lines:
+            for text in _gemini_event_texts("\n".join(data_lines), usage):
+                yield text
+
+
 STREAMERS = {
     "openai": stream_openai,
     "anthropic": stream_anthropic,
@@ -107,14 +308,19 @@ async def stream_gpt(
     session: AsyncSession,
     schema: str,
     system_prompt: str | None = None,
+    context: str | None = None,
+    usage: dict | None = None,
 ) -> AsyncGenerator[str, None]:
+    """Stream a completion from the tenant's provider.
+
+    `system_prompt` should be identical across a tenant's turns (it is marked
+    for provider prompt caching); per-turn material such as retrieved
+    documents goes in `context`. When `usage` is given it is filled with
+    input_tokens, output_tokens and cached_tokens once the stream ends.
+    """
     conn = await get_connection(provider, session, schema)
     model = conn.get("model") or PROVIDER_DEFAULTS[provider]
     streamer = STREAMERS[provider]
 
-    final_messages = messages
-    if system_prompt:
-        final_messages = [{"role": "system", "content": system_prompt}] + messages
-
-    async for chunk in streamer(final_messages, conn["api_key"], model):
+    async for chunk in streamer(messages, conn["api_key"], model, system=system_prompt, context=context, usage=usage):
         yield chunk
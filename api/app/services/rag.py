@@ -0,0 +1,152 @@
+"""Retrieval over org documents for the chat system prompt.
+
+Uploaded documents are split into overlapping chunks and embedded by the
+worker (embed_document) with the local Ollama embedding model. Each chat turn
+embeds the user message and pulls the RAG_TOP_K nearest chunks through the
+HNSW index on org_document_chunks.embedding.
+"""
+import asyncio
+
+import httpx
+import ollama
+from redis.exceptions import RedisError
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import metrics
+from app.core.cache import get_redis
+from app.core.config import settings
+from app.services.llm import llm_service
+
+EMBED_BATCH_SIZE = 32
+
+
+def chunk_text(content: str, size: int | None = None, overlap: int | None = None) -> list[str]:
+    """Split text into ~size-character chunks on paragraph boundaries where possible."""
+    size = size or settings.RAG_CHUNK_CHARS
+    overlap = settings.RAG_CHUNK_OVERLAP if overlap is None else overlap
+    # An overlap of a whole chunk or more would never advance the hard split
+    overlap = max(0, min(overlap, size // 2))
+
+    pieces: list[str] = []
+    for paragraph in content.split("\n\n"):
+        paragraph = paragraph.strip()
+        # Hard-split paragraphs that are longer than a chunk
+        while len(paragraph) > size:
+            pieces.append(paragraph[:size])
+            paragraph = paragraph[size - overlap:]
+        if paragraph:
+            pieces.append(paragraph)
+
+    chunks: list[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > size:
+            chunks.append(current)
+            # Carry the tail of the previous chunk over for context
+            current = current[-overlap:] if overlap else ""
+        current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _vector_literal(embedding: list[float]) -> str:
+    return "[" + ",".join(str(x) for x in embedding) + "]"
+
+
+async def index_document(session: AsyncSession, schema: str, document_id: str) -> int:
+    """(Re)build a document's chunks and embeddings; caller commits."""
+    result = await session.execute(
+        text(f'SELECT content_text FROM "{schema}".org_documents WHERE id = CAST(:id AS uuid)'),
+        {"id": document_id},
+    )
+    row = result.fetchone()
+    if not row:
+        return 0
+
+    chunks = chunk_text(row.content_text)
+    embeddings: list[list[float]] = []
+    for i in range(0, len(chunks), EMBED_BATCH_SIZE):
+        embeddings += await llm_service.embed(chunks[i:i + EMBED_BATCH_SIZE])
+
+    await session.execute(
+        text(f'DELETE FROM "{schema}".org_document_chunks WHERE document_id = CAST(:id AS uuid)'),
+        {"id": document_id},
+    )
+    if chunks:
+        await session.execute(
+            text(f"""
+                INSERT INTO "{schema}".org_document_chunks (document_id, chunk_index, content, embedding)
+                SELECT CAST(:id AS uuid), c.ord - 1, c.content, CAST(c.embedding AS vector)
+                FROM unnest(CAST(:contents AS text[]), CAST(:embeddings AS text[]))
+                    WITH ORDINALITY AS c(content, embedding, ord)
+            """),
+            {"id": document_id, "contents": chunks, "embeddings": [_vector_literal(e) for e in embeddings]},
+        )
+    return len(chunks)
+
+
+async def _first_documents(session: AsyncSession, schema: str) -> list[dict]:
+    result = await session.execute(
+        # build_document_context only uses the first 2,500 characters
+        text(f'SELECT filename, LEFT(content_text, 2500) AS content_text FROM "{schema}".org_documents ORDER BY created_at LIMIT 5')
+    )
+    return [dict(r._mapping) for r in result]
+
+
+async def _schedule_backfill(schema: str) -> None:
+    """Queue embedding of documents that have no chunks (at most hourly): ones
+    uploaded before chunking existed, or whose embed_document run was lost or failed."""
+    try:
+        claimed = await get_redis().set(f"rag_backfill:{schema}", 1, nx=True, ex=3600)
+    except RedisError:
+        return
+    if claimed:
+        from app.workers.tasks import embed_missing_documents
+        embed_missing_documents.delay(schema)
+
+
+async def retrieve_documents(session: AsyncSession, schema: str, query: str) -> list[dict]:
+    """Top-k chunks relevant to the query, shaped like org_documents rows
+    ({"filename", "content_text"}) for build_document_context."""
+    result = await session.execute(text(f"""
+        SELECT EXISTS (SELECT 1 FROM "{schema}".org_document_chunks) AS indexed,
+               EXISTS (SELECT 1 FROM "{schema}".org_documents) AS has_documents,
+               EXISTS (
+                   SELECT 1 FROM "{schema}".org_documents d
+                   WHERE NOT EXISTS (SELECT 1 FROM "{schema}".org_document_chunks c WHERE c.document_id = d.id)
+               ) AS has_unindexed
+    """))
+    state = result.one()
+    if not state.has_documents:
+        return []
+    if state.has_unindexed:
+        await _schedule_backfill(schema)
+    if not state.indexed:
+        return await _first_documents(session, schema)
+
+    try:
+        [embedding] = await asyncio.wait_for(
+            llm_service.embed([query[:settings.RAG_CHUNK_CHARS * 2]]),
+            settings.RAG_EMBED_TIMEOUT_SECONDS,
+        )
+    except TimeoutError:
+        # A stalled Ollama must not hold up the turn; answer without documents
+        metrics.incr("rag.embed_timeouts")
+        return []
+    except (ollama.ResponseError, httpx.HTTPError):
+        metrics.incr("rag.embed_errors")
+        return await _first_documents(session, schema)
+
+    result = await session.execute(
+        text(f"""
+            SELECT d.filename, c.content AS content_text
+            FROM "{schema}".org_document_chunks c
+            JOIN "{schema}".org_documents d ON d.id = c.document_id
+            ORDER BY c.embedding <=> CAST(:embedding AS vector)
+            LIMIT :k
+        """),
+        {"embedding": _vector_literal(embedding), "k": settings.RAG_TOP_K},
+    )
+    return [dict(r._mapping) for r in result]
@@ -63,17 +63,20 @@ VERTICAL_PROMPTS: dict[str, str] = {
 }
 
 
-def build_system_prompt(vertical: str, doc_excerpts: list[dict]) -> str:
-    """Compose the full system prompt from vertical + org documents."""
-    parts = [VERTICAL_PROMPTS.get(vertical, VERTICAL_PROMPTS["general"])]
+def build_document_context(doc_excerpts: list[dict]) -> str:
+    """The org documents section appended after the vertical prompt ("" if none)."""
+    if not doc_excerpts:
+        return ""
+    parts = [
+        "\n\nThe organization has provided the following reference documents. "
+        "Use them to inform your answers where relevant:"
+    ]
+    for doc in doc_excerpts:
+        excerpt = doc["content_text"][:2500].strip()
+        parts.append(f"\n--- {doc['filename']} ---\n{excerpt}")
+    return "\n" + "\n".join(parts)
 
-    if doc_excerpts:
-        parts.append(
-            "\n\nThe organization has provided the following reference documents. "
-            "Use them to inform your answers where relevant:"
-        )
-        for doc in doc_excerpts:
-            excerpt = doc["content_text"][:2500].strip()
-            parts.append(f"\n--- {doc['filename']} ---\n{excerpt}")
 
-    return "\n".join(parts)
+def build_system_prompt(vertical: str, doc_excerpts: list[dict]) -> str:
+    """Compose the full system prompt from vertical + org documents."""
+    return VERTICAL_PROMPTS.get(vertical, VERTICAL_PROMPTS["general"]) + build_document_context(doc_excerpts)
@@ -14,4 +14,14 @@ celery_app.conf.update(
     accept_content=["json"],
     timezone="UTC",
     enable_utc=True,
+    beat_schedule={
+        "flush-analytics": {
+            "task": "app.workers.tasks.flush_all_analytics",
+            "schedule": settings.ANALYTICS_FLUSH_INTERVAL_SECONDS,
+        },
+        "refresh-rollups": {
+            "task": "app.workers.tasks.refresh_rollups",
+            "schedule": settings.ANALYTICS_ROLLUP_INTERVAL_SECONDS,
+        },
+    },
 )
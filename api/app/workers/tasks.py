@@ -1,35 +1,67 @@
 import json
 import asyncio
+import httpx
+import ollama
+from celery.signals import worker_process_init, worker_process_shutdown
+from celery.utils.log import get_task_logger
 from app.workers.celery_app import celery_app
-from app.core.database import get_task_session
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import get_task_session, init_task_engine, dispose_task_engine
+from app.services import analytics_buffer
+from app.services.analytics import refresh_daily_rollups
+from app.services.history import summary_keep_messages
+from app.services.rag import index_document
+from app.services.document_extraction import ExtractionError, iter_text
 from app.services.llm import llm_service
 from sqlalchemy import text
 
+logger = get_task_logger(__name__)
+
+# Pages (or DOCX paragraph blocks) between progress updates on a document_uploads job
+EXTRACT_PROGRESS_EVERY = 10
+
+# One event loop per worker process, reused by every task it runs, so pooled
+# connections and clients bound to the loop survive between tasks.
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop
+
+
+@worker_process_init.connect
+def _init_worker_process(**kwargs):
+    global _loop
+    # Never reuse a loop or pool inherited from the prefork parent
+    _loop = None
+    _get_loop()
+    init_task_engine()
+
+
+@worker_process_shutdown.connect
+def _shutdown_worker_process(**kwargs):
+    if _loop is not None and not _loop.is_closed():
+        _loop.run_until_complete(dispose_task_engine())
+        _loop.close()
+
 
 def run_async(coro):
-    loop = asyncio.new_event_loop()
-    try:
-        return loop.run_until_complete(coro)
-    finally:
-        loop.close()
+    return _get_loop().run_until_complete(coro)
 
 
 @celery_app.task(bind=True, max_retries=3)
 def process_analytics(self, org_schema: str, event_type: str, user_id: str, session_id: str, metadata: dict):
+    """Write a single event directly; request handlers use analytics_buffer.record_event instead."""
     async def _run():
         session = await get_task_session(org_schema)
         try:
-            await session.execute(
-                text(f"""
-                    INSERT INTO "{org_schema}".analytics_events (event_type, user_id, session_id, metadata)
-                    VALUES (:event_type, CAST(:user_id AS uuid), CAST(:session_id AS uuid), CAST(:metadata AS jsonb))
-                """),
-                {
-                    "event_type": event_type,
-                    "user_id": user_id,
-                    "session_id": session_id,
-                    "metadata": json.dumps(metadata),
-                },
+            await analytics_buffer.insert_events(
+                session, org_schema, [analytics_buffer.make_event(event_type, user_id, session_id, metadata)],
             )
             await session.commit()
         finally:
@@ -38,6 +70,71 @@ def process_analytics(self, org_schema: str, event_type: str, user_id: str, sess
     run_async(_run())
 
 
+async def _flush_schema(org_schema: str) -> int:
+    written = 0
+    for _ in range(settings.ANALYTICS_FLUSH_MAX_BATCHES):
+        raw = await analytics_buffer.take_batch(org_schema)
+        if not raw:
+            break
+        session = await get_task_session(org_schema)
+        try:
+            await analytics_buffer.insert_events(session, org_schema, [json.loads(r) for r in raw])
+            await session.commit()
+        except Exception:
+            await analytics_buffer.requeue(org_schema, raw)
+            raise
+        finally:
+            await session.close()
+        written += len(raw)
+        metrics.incr("analytics.flushed", len(raw))
+        if len(raw) < settings.ANALYTICS_FLUSH_BATCH_SIZE:
+            break
+    await analytics_buffer.forget_if_empty(org_schema)
+    return written
+
+
+@celery_app.task
+def flush_analytics(org_schema: str):
+    return run_async(_flush_schema(org_schema))
+
+
+@celery_app.task
+def flush_all_analytics():
+    async def _run():
+        written = 0
+        for org_schema in await analytics_buffer.buffered_schemas():
+            written += await _flush_schema(org_schema)
+        return written
+
+    return run_async(_run())
+
+
+@celery_app.task
+def refresh_rollups():
+    """Rebuild recent daily rollups for tenants with chat activity since the last run."""
+    async def _run():
+        schemas = await analytics_buffer.take_dirty_rollups()
+        refreshed = 0
+        for org_schema in schemas:
+            # One failing tenant must not drop the others claimed with it
+            try:
+                session = await get_task_session(org_schema)
+                try:
+                    await refresh_daily_rollups(session)
+                    await session.commit()
+                finally:
+                    await session.close()
+            except Exception:
+                logger.exception("rollup refresh failed for %s", org_schema)
+                metrics.incr("rollups.errors")
+                await analytics_buffer.mark_rollup_dirty(org_schema)
+                continue
+            refreshed += 1
+        return refreshed
+
+    return run_async(_run())
+
+
 @celery_app.task(bind=True, max_retries=3)
 def generate_suggestions(self, org_schema: str, session_id: str, user_id: str, vertical: str = "general", doc_context: str = ""):
     async def _run():
@@ -57,14 +154,10 @@ def generate_suggestions(self, org_schema: str, session_id: str, user_id: str, v
 
             suggestions = await llm_service.generate_suggestions(messages, org_context=org_context)
 
-            for suggestion in suggestions:
-                await session.execute(
-                    text(f"""
-                        INSERT INTO "{org_schema}".analytics_events (event_type, user_id, session_id, metadata)
-                        VALUES ('suggestion_generated', CAST(:uid AS uuid), CAST(:sid AS uuid), CAST(:meta AS jsonb))
-                    """),
-                    {"uid": user_id, "sid": session_id, "meta": json.dumps({"suggestion": suggestion})},
-                )
+            await analytics_buffer.insert_events(session, org_schema, [
+                analytics_buffer.make_event("suggestion_generated", user_id, session_id, {"suggestion": suggestion})
+                for suggestion in suggestions
+            ])
             await session.commit()
         finally:
             await session.close()
@@ -95,3 +188,176 @@ def generate_session_title(org_schema: str, session_id: str):
             await session.close()
 
     run_async(_run())
+
+
+@celery_app.task
+def summarize_history(org_schema: str, session_id: str):
+    """Roll messages that have left the chat window into sessions.summary."""
+    async def _run():
+        session = await get_task_session(org_schema)
+        try:
+            result = await session.execute(
+                text(f'SELECT summary, summary_through FROM "{org_schema}".sessions WHERE id = CAST(:sid AS uuid)'),
+                {"sid": session_id},
+            )
+            row = result.fetchone()
+            if not row:
+                return
+
+            # Everything after the current summary except the newest few, oldest
+            # first, so a backlog is folded in from the watermark without gaps
+            result = await session.execute(
+                text(f"""
+                    SELECT role, content, created_at FROM (
+                        SELECT role, content, created_at
+                        FROM "{org_schema}".messages
+                        WHERE session_id = CAST(:sid AS uuid) AND was_blocked = FALSE
+                          AND (CAST(:through AS timestamptz) IS NULL OR created_at > CAST(:through AS timestamptz))
+                        ORDER BY created_at DESC
+                        OFFSET :keep
+                    ) older
+                    ORDER BY created_at
+                    LIMIT :max
+                """),
+                {
+                    "sid": session_id,
+                    "through": row.summary_through,
+                    "keep": summary_keep_messages(),
+                    "max": settings.CHAT_SUMMARY_MAX_MESSAGES,
+                },
+            )
+            older = [dict(r._mapping) for r in result]
+            if not older:
+                return
+
+            summary = await llm_service.summarize_history(row.summary, older)
+            # Guarded on summary_through so a concurrent run can't roll it back
+            await session.execute(
+                text(f"""
+                    UPDATE "{org_schema}".sessions
+                    SET summary = :summary,
+                        summary_through = :new_through,
+                        summary_message_count = (
+                            SELECT COUNT(*) FROM "{org_schema}".messages
+                            WHERE session_id = CAST(:sid AS uuid) AND created_at <= :new_through
+                        )
+                    WHERE id = CAST(:sid AS uuid)
+                      AND summary_through IS NOT DISTINCT FROM CAST(:through AS timestamptz)
+                """),
+                {"summary": summary, "new_through": older[-1]["created_at"], "sid": session_id, "through": row.summary_through},
+            )
+            await session.commit()
+        finally:
+            await session.close()
+
+    run_async(_run())
+
+
+@celery_app.task(bind=True, max_retries=3, default_retry_delay=30)
+def embed_document(self, org_schema: str, document_id: str):
+    """Chunk and embed an uploaded document for retrieval."""
+    async def _run():
+        session = await get_task_session(org_schema)
+        try:
+            count = await index_document(session, org_schema, document_id)
+            await session.commit()
+            return count
+        finally:
+            await session.close()
+
+    try:
+        return run_async(_run())
+    except (ollama.ResponseError, httpx.HTTPError) as exc:
+        # Ollama unavailable or still pulling the embedding model
+        raise self.retry(exc=exc)
+
+
+@celery_app.task
+def embed_missing_documents(org_schema: str):
+    """Queue embedding for documents that have no chunks yet."""
+    async def _run():
+        session = await get_task_session(org_schema)
+        try:
+            result = await session.execute(text(f"""
+                SELECT d.id FROM "{org_schema}".org_documents d
+                WHERE NOT EXISTS (SELECT 1 FROM "{org_schema}".org_document_chunks c WHERE c.document_id = d.id)
+            """))
+            return [str(r.id) for r in result]
+        finally:
+            await session.close()
+
+    for document_id in run_async(_run()):
+        embed_document.delay(org_schema, document_id)
+
+
+@celery_app.task
+def extract_document(org_schema: str, job_id: str):
+    """Parse a staged upload into org_documents, reporting progress on the job row."""
+    async def set_job(session, **fields):
+        assignments = ", ".join(f"{k} = :{k}" for k in fields)
+        # Jobs the API has already given up on as stale stay failed
+        await session.execute(
+            text(
+                f'UPDATE "{org_schema}".document_uploads SET {assignments}, updated_at = NOW() '
+                f"WHERE id = CAST(:id AS uuid) AND status <> 'failed'"
+            ),
+            {**fields, "id": job_id},
+        )
+        await session.commit()
+
+    async def _run():
+        session = await get_task_session(org_schema)
+        try:
+            result = await session.execute(
+                text(f"""
+                    SELECT filename, content_type, file_size, data FROM "{org_schema}".document_uploads
+                    WHERE id = CAST(:id AS uuid) AND status = 'pending'
+                """),
+                {"id": job_id},
+            )
+            job = result.fetchone()
+            if not job:
+                return None
+            await set_job(session, status="processing")
+
+            try:
+                total, parts, separator = iter_text(job.data, job.content_type)
+                texts = []
+                for done, part in enumerate(parts, start=1):
+                    texts.append(part)
+                    if done % EXTRACT_PROGRESS_EVERY == 0 and done < total:
+                        await set_job(session, progress=done * 100 // total)
+                content_text = separator.join(texts).strip()
+                if not content_text:
+                    raise ExtractionError("Could not extract any text from the file")
+            except Exception as e:
+                await set_job(session, status="failed", error=str(e)[:500], data=None)
+                return None
+
+            # Lock the job so a stale-job check can't fail it between the insert and "done"
+            result = await session.execute(
+                text(f"""
+                    SELECT 1 FROM "{org_schema}".document_uploads
+                    WHERE id = CAST(:id AS uuid) AND status = 'processing' FOR UPDATE
+                """),
+                {"id": job_id},
+            )
+            if not result.fetchone():
+                return None
+            result = await session.execute(
+                text(
+                    f'INSERT INTO "{org_schema}".org_documents (filename, content_text, file_size) '
+                    f'VALUES (:filename, :content_text, :file_size) RETURNING id'
+                ),
+                {"filename": job.filename, "content_text": content_text, "file_size": job.file_size},
+            )
+            document_id = result.scalar()
+            # The staged bytes are no longer needed once the text is stored
+            await set_job(session, status="done", progress=100, document_id=document_id, data=None)
+            return str(document_id)
+        finally:
+            await session.close()
+
+    document_id = run_async(_run())
+    if document_id:
+        embed_document.delay(org_schema, document_id)
@@ -0,0 +1,84 @@
+"""
+Benchmark: Gemini stream parsing cost vs answer length.
+Compares the old whole-buffer json.loads retry loop with the SSE parser used
+by stream_gemini (fed from an in-memory response, no network).
+Run inside Docker: docker compose exec api python bench_gemini.py
+"""
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+
+from app.services import proxy
+
+CHUNK_BYTES = 512  # size of each aiter_text() chunk in the legacy format
+
+
+def event(i: int) -> dict:
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": f"token{i} " * 8}]}}]}
+
+
+def legacy_parse(events: list[dict]) -> int:
+    """The previous stream_gemini loop: append every chunk, retry json.loads on the whole buffer."""
+    body = json.dumps(events)
+    chunks = [body[i : i + CHUNK_BYTES] for i in range(0, len(body), CHUNK_BYTES)]
+    emitted = 0
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        try:
+            data = json.loads(buffer)
+        except json.JSONDecodeError:
+            continue
+        emitted += sum(len(c["content"]["parts"]) for e in data for c in e["candidates"])
+        buffer = ""
+    return emitted
+
+
+class FakeResponse:
+    def __init__(self, lines: list[str]):
+        self._lines = lines
+
+    def raise_for_status(self):
+        pass
+
+    async def aiter_lines(self):
+        for line in self._lines:
+            yield line
+
+
+async def sse_parse(events: list[dict]) -> int:
+    lines = []
+    for e in events:
+        lines += [f"data: {json.dumps(e)}", ""]
+
+    @asynccontextmanager
+    async def fake_stream(provider, url, **kwargs):
+        yield FakeResponse(lines)
+
+    original = proxy._provider_stream
+    proxy._provider_stream = fake_stream
+    try:
+        return len([t async for t in proxy.stream_gemini([{"role": "user", "content": "hi"}], "key", "model")])
+    finally:
+        proxy._provider_stream = original
+
+
+def main():
+    print(f"{'events':>7}  {'legacy ms':>10}  {'sse ms':>8}  {'sse us/event':>13}")
+    for n in (100, 500, 1_000, 2_000, 4_000):
+        events = [event(i) for i in range(n)]
+
+        start = time.perf_counter()
+        assert legacy_parse(events) == n
+        legacy_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        assert asyncio.run(sse_parse(events)) == n
+        sse_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{n:>7}  {legacy_ms:>10.1f}  {sse_ms:>8.1f}  {sse_ms * 1000 / n:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark: keyword rule matching, naive per-rule scan vs KeywordMatcher.
+Run inside Docker: docker compose exec api python bench_keywords.py
+"""
+import random
+import string
+import time
+
+from app.services.keyword_matcher import KeywordMatcher
+
+random.seed(42)
+MESSAGE_CHARS = 4000
+RUNS = 20
+
+
+def random_word(n: int) -> str:
+    return "".join(random.choices(string.ascii_lowercase, k=n))
+
+
+def naive_first_match(keywords: list[str], lowered: str):
+    for i, kw in enumerate(keywords):
+        if kw in lowered:
+            return i
+    return None
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        fn()
+    return (time.perf_counter() - start) / RUNS * 1000
+
+
+def main():
+    message = " ".join(random_word(random.randint(3, 9)) for _ in range(MESSAGE_CHARS // 6)).lower()
+    print(f"message: {len(message)} chars, {RUNS} runs each (no keyword present -> worst case)\n")
+    print(f"{'keywords':>9}  {'naive ms':>9}  {'matcher ms':>10}  {'build ms':>9}")
+
+    for count in (10, 100, 1_000, 10_000):
+        keywords = [f"zz{random_word(8)}" for _ in range(count)]
+
+        start = time.perf_counter()
+        matcher = KeywordMatcher([(kw, i) for i, kw in enumerate(keywords)])
+        build_ms = (time.perf_counter() - start) * 1000
+
+        # Sanity: same answer as the naive scan, both on a miss and on a hit
+        assert matcher.first_match(message) == naive_first_match(keywords, message) is None
+        hit = message + " " + keywords[count // 2] + " " + keywords[-1]
+        assert matcher.first_match(hit) == naive_first_match(keywords, hit) == count // 2
+
+        naive_ms = timed(lambda keywords=keywords, message=message: naive_first_match(keywords, message))
+        matcher_ms = timed(lambda matcher=matcher, message=message: matcher.first_match(message))
+        print(f"{count:>9}  {naive_ms:>9.3f}  {matcher_ms:>10.3f}  {build_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark: /analytics/summary against a seeded tenant.
+Compares the previous seven full-scan queries, the rollup-backed single query,
+and the Redis-cached summary. Seeds a scratch schema with BENCH_MESSAGES rows
+(default 10M, spread over a year) and drops it afterwards.
+Run inside Docker: docker compose exec api python bench_summary.py
+"""
+import asyncio
+import os
+import time
+
+from sqlalchemy import text
+
+from app.core.database import engine, get_tenant_session, provision_org_schema
+from app.services.analytics import get_cached_summary, get_summary, refresh_daily_rollups
+
+SCHEMA = "org_bench_summary"
+MESSAGES = int(os.getenv("BENCH_MESSAGES", "10000000"))
+SESSIONS = 20_000
+USERS = 200
+DAYS = 30
+RUNS = 5
+
+
+async def legacy_summary(session, days: int) -> dict:
+    """The previous get_summary: seven sequential scans of messages/sessions."""
+    window = f"created_at > NOW() - INTERVAL '{days} days'"
+    total = await session.execute(text(f"SELECT COUNT(*) FROM messages WHERE {window}"))
+    blocked = await session.execute(text(f"SELECT COUNT(*) FROM messages WHERE was_blocked = TRUE AND {window}"))
+    active_sessions = await session.execute(
+        text(f"SELECT COUNT(DISTINCT id) FROM sessions WHERE updated_at > NOW() - INTERVAL '{days} days'")
+    )
+    active_users = await session.execute(
+        text(f"SELECT COUNT(DISTINCT user_id) FROM sessions WHERE updated_at > NOW() - INTERVAL '{days} days'")
+    )
+    by_provider = await session.execute(
+        text(f"SELECT gpt_target, COUNT(*) AS count FROM messages WHERE {window} GROUP BY gpt_target")
+    )
+    by_day = await session.execute(text(f"""
+        SELECT DATE(created_at) AS day, COUNT(*) AS total, SUM(CASE WHEN was_blocked THEN 1 ELSE 0 END) AS blocked
+        FROM messages WHERE {window} GROUP BY DATE(created_at) ORDER BY day
+    """))
+    top_blocked = await session.execute(text(f"""
+        SELECT block_reason, COUNT(*) AS count FROM messages
+        WHERE was_blocked = TRUE AND block_reason IS NOT NULL AND {window}
+        GROUP BY block_reason ORDER BY count DESC LIMIT 10
+    """))
+    return {
+        "total_messages": total.scalar(),
+        "blocked_messages": blocked.scalar(),
+        "active_sessions": active_sessions.scalar(),
+        "active_users": active_users.scalar(),
+        "messages_by_provider": {r.gpt_target: r.count for r in by_provider},
+        "messages_by_day": [dict(r._mapping) for r in by_day],
+        "top_blocked_rules": [dict(r._mapping) for r in top_blocked],
+    }
+
+
+async def seed():
+    async with engine.begin() as conn:
+        await conn.execute(text(f'DROP SCHEMA IF EXISTS "{SCHEMA}" CASCADE'))
+    await provision_org_schema(SCHEMA)
+    async with engine.begin() as conn:
+        await conn.execute(text(f"""
+            INSERT INTO "{SCHEMA}".users (clerk_user_id, email)
+            SELECT 'bench_' || g, 'bench' || g || '@example.com' FROM generate_series(1, {USERS}) g
+        """))
+        await conn.execute(text(f"""
+            INSERT INTO "{SCHEMA}".sessions (user_id, gpt_target, updated_at)
+            SELECT (SELECT id FROM "{SCHEMA}".users ORDER BY clerk_user_id OFFSET g % {USERS} LIMIT 1),
+                   'openai', NOW() - random() * INTERVAL '365 days'
+            FROM generate_series(1, {SESSIONS}) g
+        """))
+        await conn.execute(text(f"""
+            INSERT INTO "{SCHEMA}".messages (session_id, role, content, gpt_target, was_blocked, block_reason, created_at)
+            SELECT s.ids[1 + g % {SESSIONS}], 'user', 'bench',
+                   (ARRAY['openai', 'anthropic', 'gemini'])[1 + g % 3],
+                   g % 20 = 0,
+                   CASE WHEN g % 20 = 0 THEN 'rule_' || (g % 7) END,
+                   NOW() - random() * INTERVAL '365 days'
+            FROM generate_series(1, {MESSAGES}) g,
+                 (SELECT array_agg(id) AS ids FROM "{SCHEMA}".sessions) s
+        """))
+        await conn.execute(text(f'ANALYZE "{SCHEMA}".messages'))
+
+
+async def timed(label: str, fn) -> None:
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"{label:>22}  best {min(samples):>9.1f} ms  median {sorted(samples)[RUNS // 2]:>9.1f} ms")
+
+
+async def with_session(fn):
+    session = await get_tenant_session(SCHEMA)
+    try:
+        return await fn(session)
+    finally:
+        await session.close()
+
+
+async def main():
+    try:
+        print(f"seeding {MESSAGES:,} messages ...")
+        start = time.perf_counter()
+        await seed()
+        print(f"  seeded in {time.perf_counter() - start:.0f} s")
+
+        async def commit_rollups(session):
+            await refresh_daily_rollups(session)
+            await session.commit()
+
+        start = time.perf_counter()
+        await with_session(commit_rollups)
+        print(f"  rollup backfill: {time.perf_counter() - start:.1f} s (one-off, per tenant)")
+        start = time.perf_counter()
+        await with_session(commit_rollups)
+        print(f"  incremental rollup refresh: {(time.perf_counter() - start) * 1000:.0f} ms\n")
+
+        await timed("legacy 7 queries", lambda: with_session(lambda s: legacy_summary(s, DAYS)))
+        await timed("rollup single query", lambda: with_session(lambda s: get_summary(s, DAYS)))
+        await get_cached_summary(SCHEMA, DAYS)
+        await timed("redis-cached", lambda: get_cached_summary(SCHEMA, DAYS))
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text(f'DROP SCHEMA IF EXISTS "{SCHEMA}" CASCADE'))
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+Benchmark: process_analytics throughput, per-task loop + NullPool engine (old)
+vs the worker's persistent loop and connection pool.
+Runs the task bodies in-process against a scratch schema that is dropped after.
+Run inside Docker: docker compose exec worker python bench_tasks.py
+"""
+import asyncio
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import NullPool
+
+from app.core.config import settings
+from app.core.database import provision_org_schema, engine
+from app.workers import tasks
+
+SCHEMA = "org_bench_tasks"
+TASKS = 500
+
+
+def legacy_process_analytics(org_schema: str, event_type: str, metadata: dict):
+    """The previous task path: fresh loop, fresh engine and connection, SET search_path."""
+    async def _run():
+        task_engine = create_async_engine(settings.DATABASE_URL, poolclass=NullPool)
+        session = async_sessionmaker(task_engine, class_=AsyncSession, expire_on_commit=False)()
+        try:
+            await session.execute(text(f'SET search_path TO "{org_schema}", public'))
+            await session.execute(
+                text(f"""
+                    INSERT INTO "{org_schema}".analytics_events (event_type, metadata)
+                    VALUES (:event_type, CAST(:metadata AS jsonb))
+                """),
+                {"event_type": event_type, "metadata": "{}"},
+            )
+            await session.commit()
+        finally:
+            await session.close()
+            await task_engine.dispose()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(_run())
+    finally:
+        loop.close()
+
+
+def timed(label: str, fn) -> None:
+    start = time.perf_counter()
+    for _ in range(TASKS):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:>12}  {TASKS / elapsed:>9.0f} tasks/s  {elapsed * 1000 / TASKS:>7.2f} ms/task")
+
+
+async def setup():
+    await provision_org_schema(SCHEMA)
+    await engine.dispose()
+
+
+async def teardown():
+    async with engine.begin() as conn:
+        await conn.execute(text(f'DROP SCHEMA IF EXISTS "{SCHEMA}" CASCADE'))
+    await engine.dispose()
+
+
+def main():
+    asyncio.run(setup())
+    try:
+        print(f"{TASKS} process_analytics calls each\n")
+        timed("legacy", lambda: legacy_process_analytics(SCHEMA, "bench", {}))
+
+        # What worker_process_init does in a real worker
+        tasks._init_worker_process()
+        timed("persistent", lambda: tasks.process_analytics(SCHEMA, "bench", None, None, {}))
+        tasks._shutdown_worker_process()
+    finally:
+        asyncio.run(teardown())
+
+
+if __name__ == "__main__":
+    main()
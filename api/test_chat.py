@@ -87,6 +87,7 @@ async def test_filtering():
             """)
         )
         await s.commit()
+        await filtering_service.invalidate(SCHEMA)
 
         result = await filtering_service.evaluate("this contains badword here", s, SCHEMA)
         assert result.action == "block", f"Expected block, got {result.action}"
@@ -101,6 +102,7 @@ async def test_filtering():
             text(f"DELETE FROM \"{SCHEMA}\".filtering_rules WHERE name = 'test-block'")
         )
         await s.commit()
+        await filtering_service.invalidate(SCHEMA)
 
 
 async def test_stream():
@@ -119,6 +121,59 @@ async def test_stream():
             print(f"  FAIL: {e}")
 
 
+def test_chunk_text():
+    print("\n=== 6. Document chunking ===")
+    from app.services.rag import chunk_text
+    text_ = "x" * 5000
+    for size, overlap in [(1200, 200), (100, 100), (100, 500)]:
+        chunks = chunk_text(text_, size=size, overlap=overlap)
+        # Terminates, and chunks stay within size plus the carried-over tail
+        assert chunks and all(len(c) <= size + size // 2 + 2 for c in chunks), (size, overlap)
+        print(f"  size={size} overlap={overlap} -> {len(chunks)} chunks  PASS")
+
+
+def test_rollup_partial_failure():
+    print("\n=== 7. Rollup refresh survives a failing tenant ===")
+    from unittest import mock
+    from app.workers import tasks
+
+    class FakeSession:
+        def __init__(self, schema):
+            self.schema = schema
+
+        async def commit(self):
+            pass
+
+        async def close(self):
+            pass
+
+    async def take():
+        return ["org_a", "org_bad", "org_c"]
+
+    async def get_session(schema):
+        return FakeSession(schema)
+
+    refreshed, requeued = [], []
+
+    async def refresh(session):
+        if session.schema == "org_bad":
+            raise RuntimeError("boom")
+        refreshed.append(session.schema)
+
+    async def mark(schema):
+        requeued.append(schema)
+
+    with mock.patch.object(tasks.analytics_buffer, "take_dirty_rollups", take), \
+            mock.patch.object(tasks.analytics_buffer, "mark_rollup_dirty", mark), \
+            mock.patch.object(tasks, "get_task_session", get_session), \
+            mock.patch.object(tasks, "refresh_daily_rollups", refresh):
+        count = tasks.refresh_rollups.run()
+    assert refreshed == ["org_a", "org_c"], refreshed
+    assert requeued == ["org_bad"], requeued
+    assert count == 2, count
+    print(f"  refreshed={refreshed} requeued={requeued}  PASS")
+
+
 async def main():
     print("Starting AI Gateway tests...")
     await test_db()
@@ -127,6 +182,9 @@ async def main():
         await test_openai(api_key)
     await test_filtering()
     await test_stream()
+    test_chunk_text()
+    # Celery tasks drive their own event loop, so this one runs in a thread
+    await asyncio.to_thread(test_rollup_partial_failure)
     print("\n=== Done ===")
     await engine.dispose()
 
@@ -7,7 +7,8 @@ locals {
   ecs_secrets = [
     for key in [
       "DATABASE_URL", "REDIS_URL", "CLERK_SECRET_KEY", "CLERK_WEBHOOK_SECRET",
-      "ENCRYPTION_KEY", "OLLAMA_URL", "OLLAMA_MODEL", "APP_ENV", "CORS_ORIGINS"
+      "ENCRYPTION_KEY", "OLLAMA_URL", "OLLAMA_MODEL", "OLLAMA_EMBED_MODEL",
+      "APP_ENV", "CORS_ORIGINS"
     ] : {
       name      = key
       valueFrom = "${aws_secretsmanager_secret.app.arn}:${key}::"
@@ -122,7 +123,7 @@ resource "aws_ecs_task_definition" "worker" {
     name      = "worker"
     image     = "${aws_ecr_repository.api.repository_url}:latest"
     essential = true
-    command   = ["celery", "-A", "app.workers.celery_app", "worker", "--loglevel=info"]
+    command   = ["celery", "-A", "app.workers.celery_app", "worker", "--beat", "--loglevel=info"]
     secrets   = local.ecs_secrets
 
     logConfiguration = {
@@ -55,6 +55,7 @@ resource "aws_instance" "ollama" {
     # Wait for service to be ready, then pull model
     sleep 10
     ollama pull ${var.ollama_model}
+    ollama pull ${var.ollama_embed_model}
   EOF
 
   tags = { Name = "${local.prefix}-ollama" }
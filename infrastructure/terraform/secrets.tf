@@ -9,6 +9,7 @@ locals {
     ENCRYPTION_KEY       = var.encryption_key
     OLLAMA_URL           = "http://${aws_instance.ollama.private_ip}:11434"
     OLLAMA_MODEL         = var.ollama_model
+    OLLAMA_EMBED_MODEL   = var.ollama_embed_model
     APP_ENV              = var.environment
     CORS_ORIGINS         = "https://${local.app_domain}"
   }
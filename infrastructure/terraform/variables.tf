@@ -72,6 +72,12 @@ variable "ollama_model" {
   default     = "llama3.2"
 }
 
+variable "ollama_embed_model" {
+  description = "Ollama embedding model for document retrieval (768-dimensional)"
+  type        = string
+  default     = "nomic-embed-text"
+}
+
 variable "ollama_ami" {
   description = "AMI ID for the Ollama EC2 instance (Amazon Linux 2023)"
   type        = string
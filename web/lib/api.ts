@@ -124,8 +124,8 @@ export const getAgentContext = () => apiFetch("/chat/agent-context");
 
 export const getAnalyticsSummary = (days = 30) =>
   apiFetch(`/analytics/summary?days=${days}`);
-export const getConversations = (limit = 50, offset = 0) =>
-  apiFetch(`/analytics/conversations?limit=${limit}&offset=${offset}`);
+export const getConversations = (limit = 50, cursor?: string) =>
+  apiFetch(`/analytics/conversations?limit=${limit}${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ""}`);
 export const getConversation = (sessionId: string) =>
   apiFetch(`/analytics/conversations/${sessionId}`);
 export const getTeamAnalytics = (days = 30) =>
@@ -137,7 +137,7 @@ export const getOrgSettings = () => apiFetch("/settings/");
 
 export const getOrgLogo = () => apiFetch("/settings/logo");
 
-export const updateOrgSettings = (body: { theme?: string; org_display_name?: string; vertical?: string }) =>
+export const updateOrgSettings = (body: { theme?: string; org_display_name?: string; vertical?: string; speculative_filtering?: boolean }) =>
   apiFetch("/settings/", { method: "PATCH", body: JSON.stringify(body) });
 
 export async function uploadLogo(file: File) {
@@ -162,6 +162,8 @@ export const deleteLogo = () => apiFetch("/settings/logo", { method: "DELETE" })
 
 export const getDocuments = () => apiFetch("/admin/documents/");
 
+const DOCUMENT_JOB_TIMEOUT_MS = 10 * 60 * 1000;
+
 export async function uploadDocument(file: File) {
   const token = await getToken();
   const form = new FormData();
@@ -175,8 +177,21 @@ export async function uploadDocument(file: File) {
     const err = await res.json().catch(() => ({ detail: res.statusText }));
     throw new Error(err.detail ?? "Upload failed");
   }
-  return res.json();
+  // Extraction runs in the background; wait for the job to finish. The API
+  // fails jobs that stop making progress, this is the client's own backstop.
+  const { job_id } = await res.json();
+  const deadline = Date.now() + DOCUMENT_JOB_TIMEOUT_MS;
+  while (Date.now() < deadline) {
+    const job = await getDocumentJob(job_id);
+    if (job.status === "done") return job;
+    if (job.status === "failed") throw new Error(job.error ?? "Upload failed");
+    await new Promise((resolve) => setTimeout(resolve, 1000));
+  }
+  throw new Error("The document is still being processed. Check the document list again in a few minutes.");
 }
 
+export const getDocumentJob = (jobId: string) =>
+  apiFetch(`/admin/documents/jobs/${jobId}`);
+
 export const deleteDocument = (id: string) =>
   apiFetch(`/admin/documents/${id}`, { method: "DELETE" });